@@ -0,0 +1,98 @@
+"""
+Compare vector index types by recall@k against the exact search and by query latency.
+
+    python scripts/benchmark_index.py                       # vectors of the index at `rag_index_path`
+    python scripts/benchmark_index.py --synthetic 200000    # random clustered vectors, to plan for a larger corpus
+    python scripts/benchmark_index.py --spec '{"type": "hnsw", "hnsw_m": 16}' --spec '{"type": "ivf_flat", "nprobe": 4}'
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# add parent dir to sys.path
+sys.path.append(str(Path(__file__).parents[1]))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from src.config import api_settings  # noqa: E402
+from src.rag.store import VECTORS_FILENAME, build_ann_index  # noqa: E402
+from src.schemas.rag import IndexSpec, IndexType  # noqa: E402
+
+
+def synthetic_vectors(n: int, dimension: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Normalized vectors grouped around random centers, roughly like embeddings of real text.
+    """
+    centers = rng.normal(size=(max(1, n // 100), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.normal(size=(n, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark(spec: IndexSpec, vectors: np.ndarray, queries: np.ndarray, exact: np.ndarray, k: int) -> dict:
+    start = time.perf_counter()
+    index = build_ann_index(vectors, spec)
+    build_seconds = time.perf_counter() - start
+
+    def search(query: np.ndarray) -> np.ndarray:
+        if index is None:
+            return faiss.knn(query, vectors, k)[1]
+        return index.search(query, k)[1]
+
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found.append(search(query[None, :])[0])
+        latencies.append(time.perf_counter() - start)
+
+    recall = np.mean([len(set(f) & set(e)) / k for f, e in zip(found, exact, strict=True)])
+    size = vectors.nbytes if index is None else faiss.serialize_index(index).nbytes
+    return {
+        "index": spec.factory_string(len(vectors)) if index is not None else "Flat",
+        f"recall@{k}": f"{recall:.3f}",
+        "p50, ms": f"{np.percentile(latencies, 50) * 1000:.2f}",
+        "p95, ms": f"{np.percentile(latencies, 95) * 1000:.2f}",
+        "build, s": f"{build_seconds:.1f}",
+        "size, MB": f"{size / 2**20:.1f}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", default=api_settings.rag_index_path, help="Index to take the vectors from")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="Use N random vectors instead of the index")
+    parser.add_argument("--dimension", type=int, default=1024, help="Dimension of synthetic vectors")
+    parser.add_argument("--spec", action="append", default=[], help="Index spec as JSON, may be repeated")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("-k", type=int, default=25, help="Number of neighbours to retrieve")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dimension, rng)
+    else:
+        vectors = np.load(Path(args.index_path) / VECTORS_FILENAME)
+    k = min(args.k, len(vectors))
+
+    # queries are perturbed chunk vectors, so they are close to the corpus but not equal to its vectors
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.05 * queries.std() * rng.normal(size=queries.shape).astype(np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.knn(queries, vectors, k)[1]
+
+    specs = [IndexSpec.model_validate_json(spec) for spec in args.spec] or [
+        IndexSpec(type=index_type) for index_type in IndexType
+    ]
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries, k={k}")
+    rows = [benchmark(spec, vectors, queries, exact, k) for spec in specs]
+    widths = {column: max(len(column), *(len(row[column]) for row in rows)) for column in rows[0]}
+    print(" | ".join(column.ljust(width) for column, width in widths.items()))
+    print("-|-".join("-" * width for width in widths.values()))
+    for row in rows:
+        print(" | ".join(row[column].ljust(width) for column, width in widths.items()))
+
+
+if __name__ == "__main__":
+    main()
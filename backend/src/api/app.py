@@ -1,11 +1,16 @@
-from fastapi import FastAPI
+import math
+
+import httpx
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi_derive_responses import AutoDeriveResponsesAPIRoute
 from fastapi_swagger import patch_fastapi
 
 import src.api.logging_  # noqa: F401
 from src.api.lifespan import lifespan
 from src.config import api_settings
+from src.upstream import UpstreamBusyError
 
 app = FastAPI(
     docs_url=None, swagger_ui_oauth2_redirect_url=None, root_path=api_settings.app_root_path, lifespan=lifespan
@@ -22,10 +27,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(UpstreamBusyError)
+async def upstream_busy_handler(_request: Request, exc: UpstreamBusyError) -> JSONResponse:
+    # MWS GPT API quota is exhausted, the client should come back later instead of queueing forever
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+
+@app.exception_handler(httpx.TransportError)
+async def upstream_unavailable_handler(_request: Request, exc: httpx.TransportError) -> JSONResponse:
+    # retries are exhausted, report a gateway error instead of an internal one
+    status_code = 504 if isinstance(exc, httpx.TimeoutException) else 502
+    return JSONResponse(status_code=status_code, content={"detail": f"MWS GPT API is unavailable: {exc!r}"})
+
+
 from src.api.chat.routes import router as chat_router  # noqa: E402
 from src.api.dialog.routes import router as dialog_router  # noqa: E402
+from src.api.jobs.routes import router as jobs_router  # noqa: E402
 from src.api.message.routes import router as messages_router  # noqa: E402
+from src.api.status.routes import router as status_router  # noqa: E402
 
 app.include_router(messages_router)
 app.include_router(dialog_router)
 app.include_router(chat_router)
+app.include_router(jobs_router)
+app.include_router(status_router)
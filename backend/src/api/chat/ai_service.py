@@ -1,16 +1,62 @@
+import asyncio
 import json
 import re
+from collections.abc import AsyncIterator, Awaitable
 from typing import Any
 
 from fastapi import HTTPException
-from httpx import AsyncClient, HTTPStatusError, Timeout
+from httpx import HTTPStatusError, Response
+from pydantic import BaseModel
 
+from src.api.chat.response_cache import ResponseCache
+from src.api.logging_ import logger
 from src.config import api_settings
 from src.rag import VectorRetriever
-from src.schemas import ViewMessage
+from src.schemas import SpeculationStats, ViewMessage
 from src.schemas.chat import Models, Roles
+from src.upstream import ModelRouter, MwsClient, resilient_request, upstream_timeout
 
 MWS_GPT_API_ENDPOINT = api_settings.mws_gpt_api_url + "/v1/chat/completions"
+CHAT_COMPLETIONS = "chat/completions"
+"Name of the endpoint for the upstream limiter"
+
+
+class ModelCompletion(BaseModel):
+    content: str
+    "Generated message"
+    prompt_tokens: int = 0
+    "Number of prompt tokens reported by the API"
+    completion_tokens: int = 0
+    "Number of generated tokens reported by the API"
+
+
+async def complete_model(
+    messages: list[dict[str, str]],
+    model: Models,
+    temperature: float = 0.5,
+) -> ModelCompletion:
+    """
+    Make a single chat completion call to the specified model and return the message with token usage.
+    """
+    payload = {
+        "model": model.value,
+        "messages": messages,
+        "temperature": temperature,
+    }
+    client = MwsClient.get()
+    async with resilient_request(
+        CHAT_COMPLETIONS,
+        model,
+        lambda: client.post(MWS_GPT_API_ENDPOINT, json=payload, timeout=upstream_timeout()),
+    ) as resp:
+        resp.raise_for_status()
+        data = resp.json()
+    usage = data.get("usage") or {}
+    return ModelCompletion(
+        content=data["choices"][0]["message"]["content"],
+        prompt_tokens=usage.get("prompt_tokens") or 0,
+        completion_tokens=usage.get("completion_tokens") or 0,
+    )
 
 
 async def call_model(
@@ -21,21 +67,101 @@ async def call_model(
     """
     Make a single chat completion call to the specified model.
     """
+    completion = await complete_model(messages, model, temperature)
+    return completion.content
+
+
+async def stream_model(
+    messages: list[dict[str, str]],
+    model: Models,
+    temperature: float = 0.5,
+) -> AsyncIterator[str]:
+    """
+    Make a streaming chat completion call to the specified model and yield content deltas as they arrive.
+    """
     payload = {
         "model": model.value,
         "messages": messages,
         "temperature": temperature,
+        "stream": True,
     }
-    headers = {"Authorization": f"Bearer {api_settings.mws_gpt_api_key.get_secret_value()}"}
-    async with AsyncClient() as client:
-        resp = await client.post(
-            MWS_GPT_API_ENDPOINT,
-            json=payload,
-            headers=headers,
-            timeout=Timeout(20, read=None),
-        )
-        resp.raise_for_status()
-        return resp.json()["choices"][0]["message"]["content"]
+    client = MwsClient.get()
+
+    def send() -> Awaitable[Response]:
+        request = client.build_request("POST", MWS_GPT_API_ENDPOINT, json=payload, timeout=upstream_timeout())
+        return client.send(request, stream=True)
+
+    # only opening the stream is retried, the limiter slot is held until the whole answer is streamed
+    async with resilient_request(CHAT_COMPLETIONS, model, send) as resp:
+        if resp.is_error:
+            await resp.aread()
+            resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line.removeprefix("data:").strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta:
+                yield delta
+
+
+class ThinkStripper:
+    """
+    Incrementally removes `<think>...</think>` blocks from streamed text.
+    Text that may be the beginning of a tag is held back until the next chunk arrives.
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._inside = False
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def feed(self, text: str) -> str:
+        """
+        Add a chunk of text and return the part of it that is safe to show.
+        """
+        self._buffer += text
+        visible: list[str] = []
+        while self._buffer:
+            if self._inside:
+                end = self._buffer.find(self.CLOSE_TAG)
+                if end == -1:
+                    keep = self._partial_tag_length(self._buffer, self.CLOSE_TAG)
+                    self._buffer = self._buffer[len(self._buffer) - keep :]
+                    break
+                self._buffer = self._buffer[end + len(self.CLOSE_TAG) :]
+                self._inside = False
+            else:
+                start = self._buffer.find(self.OPEN_TAG)
+                if start == -1:
+                    keep = self._partial_tag_length(self._buffer, self.OPEN_TAG)
+                    visible.append(self._buffer[: len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep :]
+                    break
+                visible.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(self.OPEN_TAG) :]
+                self._inside = True
+        return "".join(visible)
+
+    def flush(self) -> str:
+        """
+        Return the held back text at the end of the stream. An unterminated think block is dropped.
+        """
+        rest = "" if self._inside else self._buffer
+        self._buffer = ""
+        return rest
 
 
 class ConditionalPipeline:
@@ -45,6 +171,9 @@ class ConditionalPipeline:
       2. Validate user_input (with conversation history) -> expect JSON { is_valid: bool, message: str }
       3. If invalid -> return validation message
       4. If valid   -> send to main model and return its output
+
+    In speculative mode the main model is called concurrently with the validation,
+    and its answer is cancelled or discarded if the validation fails.
     """
 
     INNER_VALIDATION_SYSTEM_PROMPT = """
@@ -65,6 +194,9 @@ class ConditionalPipeline:
         main_model: Models,
         validation_temperature: float = 0.2,
         main_temperature: float = 0.35,
+        speculative: bool = False,
+        response_cache: ResponseCache | None = None,
+        history_summary: str | None = None,
     ):
         self.main_system_prompt = main_system_prompt
         self.validation_prompt = validation_prompt
@@ -72,10 +204,38 @@ class ConditionalPipeline:
         self.main_model = main_model
         self.validation_temperature = validation_temperature
         self.main_temperature = main_temperature
+        self.speculative = speculative
+        self.response_cache = response_cache if response_cache and response_cache.enabled_for(main_model) else None
+        self.validation_result: dict[str, Any] | None = None
+        self.history_summary = history_summary
+        # the model that produced the answer, the router may choose the fallback of `main_model`
+        self.used_model: Models | None = None
+
+    speculation_stats = SpeculationStats()
+    "Counters of speculative runs of all pipelines in the worker"
+
+    @classmethod
+    def _record_speculation(
+        cls, *, accepted: bool, saved: float = 0.0, wasted: ModelCompletion | None = None, cancelled: bool = False
+    ) -> None:
+        stats = cls.speculation_stats
+        stats.runs += 1
+        if accepted:
+            stats.accepted += 1
+            stats.saved_seconds += saved
+        else:
+            stats.discarded += 1
+        if wasted is not None:
+            stats.wasted_prompt_tokens += wasted.prompt_tokens
+            stats.wasted_completion_tokens += wasted.completion_tokens
+        if cancelled:
+            stats.cancelled_calls += 1
 
     async def validate(self, history: list[ViewMessage] | None = None) -> dict[str, Any]:
         user_query: str = history[-1].message if history else ""
-        doc_ctx: str = VectorRetriever.retrieve(user_query)
+        doc_ctx: str = await VectorRetriever.aretrieve(
+            user_query, token_budget=api_settings.context_token_budget(self.validation_model)
+        )
         compiled_validation_prompt: str = (
             "You have access to the following documentation. Use that documentation for checking if dialog meets the requirements:\n\n"
             f"{doc_ctx}\n\n"
@@ -86,7 +246,7 @@ class ConditionalPipeline:
         messages: list[dict[str, str]] = [
             {"role": Roles.SYSTEM.value, "content": compiled_validation_prompt},
         ]
-        messages.extend([{"role": msg.role.value, "content": msg.message} for msg in (history or [])])
+        messages.extend(self._history_messages(history))
 
         raw = await call_model(messages, self.validation_model, self.validation_temperature)
         raw = re.sub(r"<think>.*?</think>", "", raw, flags=re.DOTALL)
@@ -99,14 +259,61 @@ class ConditionalPipeline:
             json_str = raw.strip()
 
         try:
-            return json.loads(json_str)
+            self.validation_result = json.loads(json_str)
         except json.JSONDecodeError:
-            return {"is_valid": False, "message": f"Invalid JSON from validator: {json_str}"}
+            self.validation_result = {
+                "is_valid": False,
+                "message": f"Invalid JSON from validator: {json_str}",
+                "is_error": True,
+            }
+        return self.validation_result
+
+    async def _response_cache_keys(self, history: list[ViewMessage] | None) -> tuple[str, str, str] | None:
+        """
+        Keys of the answer in the response cache: exact key, key without the last message and the last message.
+        """
+        if self.response_cache is None or not history:
+            return None
+        user_query = history[-1].message
+        doc_ctx = await VectorRetriever.aretrieve(
+            user_query, token_budget=api_settings.context_token_budget(self.main_model)
+        )
+        exact_key, prefix_key = self.response_cache.make_keys(
+            models=[self.validation_model, self.main_model],
+            prompts=[self.validation_prompt, self.main_system_prompt, self.history_summary or ""],
+            doc_ctx=doc_ctx,
+            history=[{"role": msg.role.value, "content": msg.message} for msg in history],
+        )
+        return exact_key, prefix_key, user_query
+
+    def _is_cacheable(self) -> bool:
+        # do not remember answers produced after the validator returned garbage
+        return self.validation_result is not None and not self.validation_result.get("is_error")
 
     async def run(
         self,
         history: list[ViewMessage] | None = None,
+        refresh_cache: bool = False,
     ) -> str:
+        """
+        Run the pipeline and return the answer.
+        Answers are served from the response cache if it is set, `refresh_cache` forces a new answer to be generated.
+        """
+        cache_keys = await self._response_cache_keys(history)
+        if cache_keys is not None and not refresh_cache:
+            cached = await self.response_cache.get(*cache_keys)
+            if cached is not None:
+                return cached
+
+        answer = await self._run(history)
+        if cache_keys is not None and self._is_cacheable():
+            await self.response_cache.set(*cache_keys, answer)
+        return answer
+
+    async def _run(self, history: list[ViewMessage] | None) -> str:
+        if self.speculative:
+            return await self._run_speculative(history)
+
         try:
             result = await self.validate(history)
         except HTTPStatusError as e:
@@ -115,8 +322,154 @@ class ConditionalPipeline:
         if not result.get("is_valid"):
             return result.get("message", "Validation failed without message.")
 
+        messages = await self.compile_main_messages(history)
+        completion = await self._complete_main(messages)
+        return completion.content
+
+    async def _complete_main(self, messages: list[dict[str, str]]) -> ModelCompletion:
+        completion, self.used_model = await ModelRouter.complete(
+            self.main_model, lambda model: complete_model(messages, model, self.main_temperature)
+        )
+        return completion
+
+    async def _stream_main(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        async for model, delta in ModelRouter.stream(
+            self.main_model, lambda model: stream_model(messages, model, self.main_temperature)
+        ):
+            self.used_model = model
+            yield delta
+
+    async def _generate(self, history: list[ViewMessage] | None) -> tuple[ModelCompletion, float]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        messages = await self.compile_main_messages(history)
+        completion = await self._complete_main(messages)
+        return completion, loop.time() - start
+
+    async def _run_speculative(self, history: list[ViewMessage] | None) -> str:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        generation = asyncio.create_task(self._generate(history))
+        try:
+            try:
+                result = await self.validate(history)
+            except HTTPStatusError as e:
+                raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+            validation_time = loop.time() - start
+
+            if not result.get("is_valid"):
+                if generation.done() and not generation.cancelled() and generation.exception() is None:
+                    completion, _ = generation.result()
+                    self._record_speculation(accepted=False, wasted=completion)
+                else:
+                    generation.cancel()
+                    self._record_speculation(accepted=False, cancelled=True)
+                logger.info(f"Speculative generation by {self.main_model} discarded after failed validation")
+                return result.get("message", "Validation failed without message.")
+
+            completion, generation_time = await generation
+            saved = min(validation_time, generation_time)
+            self._record_speculation(accepted=True, saved=saved)
+            logger.info(f"Speculative generation by {self.main_model} accepted, saved {int(saved * 1000)} ms")
+            return completion.content
+        finally:
+            generation.cancel()
+
+    async def run_stream(
+        self,
+        history: list[ViewMessage] | None = None,
+        refresh_cache: bool = False,
+    ) -> AsyncIterator[str]:
+        """
+        Same as `run`, but yields the main model answer by chunks as it is generated.
+        The validation verdict is awaited in full, an invalid request yields the validation message as a single chunk.
+        A cached answer is yielded as a single chunk.
+        """
+        cache_keys = await self._response_cache_keys(history)
+        if cache_keys is not None and not refresh_cache:
+            cached = await self.response_cache.get(*cache_keys)
+            if cached is not None:
+                yield cached
+                return
+
+        content: list[str] = []
+        async for delta in self._run_stream(history):
+            content.append(delta)
+            yield delta
+        if cache_keys is not None and self._is_cacheable():
+            await self.response_cache.set(*cache_keys, "".join(content))
+
+    async def _run_stream(self, history: list[ViewMessage] | None) -> AsyncIterator[str]:
+        if self.speculative:
+            async for delta in self._run_stream_speculative(history):
+                yield delta
+            return
+
+        try:
+            result = await self.validate(history)
+        except HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+
+        if not result.get("is_valid"):
+            yield result.get("message", "Validation failed without message.")
+            return
+
+        messages = await self.compile_main_messages(history)
+        try:
+            async for delta in self._stream_main(messages):
+                yield delta
+        except HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+
+    async def _run_stream_speculative(self, history: list[ViewMessage] | None) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first_delta_at: float | None = None
+        # deltas of the main model are buffered until the validation passes, `None` marks the end of the stream
+        buffer: asyncio.Queue[str | BaseException | None] = asyncio.Queue()
+
+        async def produce() -> None:
+            nonlocal first_delta_at
+            try:
+                messages = await self.compile_main_messages(history)
+                async for delta in self._stream_main(messages):
+                    if first_delta_at is None:
+                        first_delta_at = loop.time()
+                    buffer.put_nowait(delta)
+                buffer.put_nowait(None)
+            except Exception as e:
+                buffer.put_nowait(e)
+
+        generation = asyncio.create_task(produce())
+        try:
+            try:
+                result = await self.validate(history)
+            except HTTPStatusError as e:
+                raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+            validated_at = loop.time()
+
+            if not result.get("is_valid"):
+                self._record_speculation(accepted=False, cancelled=not generation.done())
+                generation.cancel()
+                yield result.get("message", "Validation failed without message.")
+                return
+
+            saved = validated_at - start if first_delta_at is None else first_delta_at - start
+            self._record_speculation(accepted=True, saved=min(saved, validated_at - start))
+            while (item := await buffer.get()) is not None:
+                if isinstance(item, HTTPStatusError):
+                    raise HTTPException(status_code=item.response.status_code, detail=item.response.json())
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            generation.cancel()
+
+    async def compile_main_messages(self, history: list[ViewMessage] | None = None) -> list[dict[str, str]]:
         user_query: str = history[-1].message if history else ""
-        doc_ctx: str = VectorRetriever.retrieve(user_query)
+        doc_ctx: str = await VectorRetriever.aretrieve(
+            user_query, token_budget=api_settings.context_token_budget(self.main_model)
+        )
         final_system_prompt: str = (
             "You have access to the following documentation:\n\n"
             f"{doc_ctx}\n\n"
@@ -126,14 +479,20 @@ class ConditionalPipeline:
 
         messages: list[dict[str, str]] = [{"role": Roles.SYSTEM.value, "content": final_system_prompt}]
 
-        messages.extend(
-            [
+        messages.extend(self._history_messages(history))
+        return messages
+
+    def _history_messages(self, history: list[ViewMessage] | None) -> list[dict[str, str]]:
+        """
+        Dialog history for the models, preceded by the summary of the turns left out of it.
+        """
+        messages: list[dict[str, str]] = []
+        if self.history_summary:
+            messages.append(
                 {
-                    "role": msg.role.value,
-                    "content": msg.message,
+                    "role": Roles.SYSTEM.value,
+                    "content": f"Summary of the earlier part of the dialog:\n{self.history_summary}",
                 }
-                for msg in (history or [])
-            ]
-        )
-
-        return await call_model(messages, self.main_model, self.main_temperature)
+            )
+        messages.extend({"role": msg.role.value, "content": msg.message} for msg in (history or []))
+        return messages
@@ -0,0 +1,129 @@
+__all__ = ["complete_dialog", "error_response", "make_pipeline", "regenerate_answer", "sse", "user_message_to_answer"]
+
+import json
+from typing import Any
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.api.chat.ai_service import ConditionalPipeline
+from src.api.chat.constants import SYSTEM_PROMPT, VALIDATION_PROMPT
+from src.api.chat.history import compact_history
+from src.api.chat.response_cache import response_cache
+from src.config import api_settings
+from src.db.repositories import dialog_repository, messages_repository
+from src.schemas import CreateMessage, ViewMessage
+from src.schemas.chat import Models, Roles
+from src.upstream import UpstreamBusyError
+
+
+def make_pipeline(model: Models, history_summary: str | None) -> ConditionalPipeline:
+    return ConditionalPipeline(
+        main_system_prompt=SYSTEM_PROMPT,
+        validation_prompt=VALIDATION_PROMPT,
+        validation_model=Models.LLAMA_3_3,
+        main_model=model,
+        speculative=api_settings.speculative_generation,
+        response_cache=response_cache,
+        history_summary=history_summary,
+    )
+
+
+def user_message_to_answer(dialog_id: int, history: list[ViewMessage] | None) -> ViewMessage | None:
+    """
+    The last message of the dialog, it must be a user message. Raises 404 if there is no dialog.
+    """
+    if history is None:
+        raise HTTPException(404, f"dialog {dialog_id} not found")
+
+    last_message = history[-1] if history else None
+    if last_message and last_message.role != Roles.USER:
+        raise HTTPException(400, "last message is already an AI reply")
+    return last_message
+
+
+async def complete_dialog(
+    session: AsyncSession, dialog_id: int, model: Models, reply_to: int | None = None
+) -> ViewMessage:
+    """
+    Generate and save an AI response to the last user message in a dialog.
+    If `reply_to` is given, that message must still be the last one.
+    """
+    history = await dialog_repository.get_history(dialog_id, session)
+    # end the read transaction, so the connection is not held while the answer is generated
+    await session.commit()
+    last_message = user_message_to_answer(dialog_id, history)
+    if reply_to is not None and (last_message is None or last_message.id != reply_to):
+        raise HTTPException(409, f"message {reply_to} is no longer the last message of dialog {dialog_id}")
+
+    window = await compact_history(dialog_id, history, [Models.LLAMA_3_3, model])
+    pipeline = make_pipeline(model, window.summary)
+    assistant_content = await pipeline.run(
+        history=window.messages,
+    )
+
+    assistant_msg = CreateMessage(
+        dialog_id=dialog_id,
+        role=Roles.ASSISTANT,
+        message=assistant_content,
+        reply_to=last_message.id,
+        model=pipeline.used_model or model,
+    )
+    saved_assistant = await messages_repository.create_message(assistant_msg, session)
+
+    return ViewMessage.model_validate(saved_assistant)
+
+
+async def regenerate_answer(session: AsyncSession, message_id: int) -> ViewMessage:
+    """
+    Replace an AI response with a new one.
+    """
+    response = await messages_repository.get_message_by_id(message_id, session)
+    if response is None:
+        raise HTTPException(404, f"Message not found: {message_id}")
+
+    request = await messages_repository.get_request(message_id, session)
+    if request is None:
+        raise HTTPException(400, "message is not response")
+
+    await messages_repository.delete_message(message_id, session)
+
+    history = await dialog_repository.get_history(request.dialog_id, session)
+    await session.commit()
+
+    window = await compact_history(request.dialog_id, history, [Models.LLAMA_3_3, response.model])
+    pipeline = make_pipeline(response.model, window.summary)
+    assistant_content = await pipeline.run(
+        history=window.messages,
+        refresh_cache=True,
+    )
+
+    assistant_msg = CreateMessage(
+        dialog_id=request.dialog_id,
+        role=Roles.ASSISTANT,
+        message=assistant_content,
+        model=pipeline.used_model or response.model,
+        reply_to=request.id,
+    )
+    saved_assistant = await messages_repository.create_message(assistant_msg, session)
+    return ViewMessage.model_validate(saved_assistant)
+
+
+def error_response(e: Exception) -> tuple[int, Any] | None:
+    """
+    Status code and detail the API answers with for an error of the pipeline, None for unexpected errors.
+    """
+    if isinstance(e, HTTPException):
+        return e.status_code, e.detail
+    if isinstance(e, UpstreamBusyError):
+        return 503, str(e)
+    if isinstance(e, httpx.TransportError):
+        status_code = 504 if isinstance(e, httpx.TimeoutException) else 502
+        return status_code, f"MWS GPT API is unavailable: {e!r}"
+    return None
+
+
+def sse(event: str, data: dict | str) -> str:
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
@@ -30,3 +30,9 @@ Follow these rules:
 
 Your responses should be technically accurate while remaining helpful and user-friendly. Focus on producing correct JSON schemas that meet the documentation requirements.
 """.strip()
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and a JSON schema generator assistant.
+Update the summary with the new messages. Keep the user's requirements, decisions, field names and values, integration steps and open questions. Drop greetings, repetitions and JSON schemas: the latest schema is kept separately.
+Reply with the updated summary only, as short plain-text notes no longer than {max_words} words.
+""".strip()
@@ -0,0 +1,103 @@
+__all__ = ["HistoryWindow", "compact_history"]
+
+import re
+from typing import NamedTuple
+
+from httpx import HTTPError
+
+from src.api.chat.ai_service import call_model
+from src.api.chat.constants import SUMMARY_PROMPT
+from src.api.logging_ import logger
+from src.config import api_settings
+from src.db.repositories import dialog_repository
+from src.rag import estimate_tokens
+from src.schemas import ViewMessage
+from src.schemas.chat import Models, Roles
+from src.upstream import UpstreamBusyError
+
+SCHEMA_PATTERN = re.compile(r"```(?:json)?\s*[{\[]")
+"Beginning of a JSON code block, the assistant puts generated schemas into them"
+
+
+class HistoryWindow(NamedTuple):
+    summary: str | None
+    "Summary of the turns left out, None if the whole history fits"
+    messages: list[ViewMessage]
+    "Messages sent verbatim, oldest first"
+
+
+def _latest_schema(history: list[ViewMessage]) -> ViewMessage | None:
+    for message in reversed(history):
+        if message.role == Roles.ASSISTANT and SCHEMA_PATTERN.search(message.message):
+            return message
+    return None
+
+
+def _recent_turns(history: list[ViewMessage], budget: int, free: ViewMessage | None) -> list[ViewMessage]:
+    """
+    The longest suffix of the history that fits into the budget, starting at a user message when possible.
+    The last message is always included, the `free` message is not counted.
+    """
+    used, start = 0, len(history)
+    while start > 0:
+        message = history[start - 1]
+        cost = 0 if message is free else estimate_tokens(message.message)
+        if used + cost > budget and start < len(history):
+            break
+        used += cost
+        start -= 1
+    # a window starting with the answer to a dropped question is confusing for the models
+    while start < len(history) - 1 and history[start].role != Roles.USER:
+        start += 1
+    return history[start:]
+
+
+async def _summarize(summary: str | None, messages: list[ViewMessage]) -> str:
+    max_words = api_settings.history_summary_token_budget * 3 // 4
+    transcript = "\n\n".join(f"{message.role.value}: {message.message}" for message in messages)
+    prompt = f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"
+    return await call_model(
+        [
+            {"role": Roles.SYSTEM.value, "content": SUMMARY_PROMPT.format(max_words=max_words)},
+            {"role": Roles.USER.value, "content": prompt},
+        ],
+        api_settings.history_summary_model,
+        temperature=0.2,
+    )
+
+
+async def compact_history(dialog_id: int, history: list[ViewMessage], models: list[Models]) -> HistoryWindow:
+    """
+    Fit the dialog history into the smallest history token budget of the models.
+
+    The latest generated schema and the most recent turns are kept verbatim, older turns are replaced by the rolling
+    summary stored in the dialog. The summary is extended only by the turns that left the window since it was stored,
+    so each message is summarised once.
+    """
+    budgets = [budget for model in models if (budget := api_settings.history_budget(model)) is not None]
+    if not budgets or sum(estimate_tokens(message.message) for message in history) <= min(budgets):
+        return HistoryWindow(None, history)
+    budget = min(budgets)
+
+    summary, summary_until_id = await dialog_repository.get_summary(dialog_id)
+    schema = _latest_schema(history)
+    reserved = api_settings.history_summary_token_budget + (estimate_tokens(schema.message) if schema else 0)
+    recent = _recent_turns(history, max(budget - reserved, 0), schema)
+    if summary_until_id is not None:
+        # the window may have grown back after deletions, messages are not repeated after the summary
+        recent = [message for message in recent[:-1] if message.id > summary_until_id] + recent[-1:]
+
+    older = [message for message in history if message.id < recent[0].id and message is not schema]
+    pending = [message for message in older if summary_until_id is None or message.id > summary_until_id]
+    if pending:
+        try:
+            summary = await _summarize(summary, pending)
+        except (HTTPError, UpstreamBusyError) as e:
+            # the turns are left out without summary this time, they are summarised by the next request
+            logger.warning(f"Failed to summarise history of dialog {dialog_id}: {e!r}")
+        else:
+            await dialog_repository.save_summary(dialog_id, summary, pending[-1].id)
+
+    messages = [schema, *recent] if schema is not None and schema.id < recent[0].id else recent
+    logger.info(f"History of dialog {dialog_id} compacted: {len(history)} messages -> summary + {len(messages)}")
+    return HistoryWindow(summary, messages)
@@ -0,0 +1,105 @@
+__all__ = ["ResponseCache", "response_cache"]
+
+import hashlib
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+from src.cache import AsyncTTLCache
+from src.config import api_settings
+from src.rag import VectorRetriever
+from src.schemas.chat import Models
+from src.schemas.status import ResponseCacheStats
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of final pipeline answers.
+
+    Exact tier is keyed by a hash of everything the answer depends on: models, prompts, documentation context and
+    dialog history. Optional near-duplicate tier reuses an answer when everything except the last user message is equal
+    and the last messages are close in the embedding space.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float | None = None,
+        similarity_threshold: float | None = None,
+        disabled_models: list[Models] | None = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self.disabled_models = set(disabled_models or [])
+        self._exact = AsyncTTLCache(maxsize, ttl)
+        # exact key -> (key of everything except the last message, normalized embedding of the last message)
+        self._vectors: OrderedDict[str, tuple[str, np.ndarray]] = OrderedDict()
+        self._stats = ResponseCacheStats(exact=self._exact.stats())
+
+    def enabled_for(self, model: Models) -> bool:
+        return self.maxsize > 0 and model not in self.disabled_models
+
+    @staticmethod
+    def make_keys(
+        models: list[Models], prompts: list[str], doc_ctx: str, history: list[dict[str, str]]
+    ) -> tuple[str, str]:
+        """
+        Return the exact key and the key of the context without the last message.
+        """
+        prefix_key = _digest([m.value for m in models], prompts, history[:-1])
+        exact_key = _digest(prefix_key, doc_ctx, history[-1:])
+        return exact_key, prefix_key
+
+    async def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(await VectorRetriever.aembed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def get(self, exact_key: str, prefix_key: str, query: str) -> str | None:
+        answer = self._exact.get(exact_key)
+        if answer is not None or self.similarity_threshold is None:
+            return answer
+
+        vector = await self._embed(query)
+        best_key, best_score = None, self.similarity_threshold
+        for key, (candidate_prefix, candidate) in self._vectors.items():
+            if candidate_prefix != prefix_key:
+                continue
+            score = float(np.dot(vector, candidate))
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        answer = self._exact.get(best_key) if best_key is not None else None
+        if answer is None:
+            self._stats.semantic_misses += 1
+            return None
+        self._stats.semantic_hits += 1
+        self._vectors.move_to_end(best_key)
+        return answer
+
+    async def set(self, exact_key: str, prefix_key: str, query: str, answer: str) -> None:
+        self._exact.set(exact_key, answer)
+        if self.similarity_threshold is None:
+            return
+        self._vectors[exact_key] = (prefix_key, await self._embed(query))
+        self._vectors.move_to_end(exact_key)
+        while len(self._vectors) > self.maxsize:
+            self._vectors.popitem(last=False)
+
+    def stats(self) -> ResponseCacheStats:
+        snapshot = self._stats.model_copy()
+        snapshot.exact = self._exact.stats()
+        return snapshot
+
+
+response_cache: ResponseCache = ResponseCache(
+    maxsize=api_settings.response_cache_size,
+    ttl=api_settings.response_cache_ttl,
+    similarity_threshold=api_settings.response_cache_similarity_threshold,
+    disabled_models=api_settings.response_cache_disabled_models,
+)
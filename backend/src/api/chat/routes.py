@@ -1,26 +1,42 @@
+from collections.abc import AsyncIterator
+
+import anyio
+import httpx
 from fastapi import APIRouter, Body, HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi_derive_responses import AutoDeriveResponsesAPIRoute
 
-from src.api.chat.ai_service import ConditionalPipeline
-from src.api.chat.constants import SYSTEM_PROMPT, VALIDATION_PROMPT
+from src.api.chat.ai_service import ThinkStripper
+from src.api.chat.completion import (
+    complete_dialog,
+    error_response,
+    make_pipeline,
+    regenerate_answer,
+    sse,
+    user_message_to_answer,
+)
+from src.api.chat.history import compact_history
+from src.api.dependencies import DbSession
+from src.api.logging_ import logger
 from src.db.repositories import dialog_repository, messages_repository
 from src.schemas import CreateMessage, ViewMessage
 from src.schemas.chat import Models, Roles
+from src.upstream import UpstreamBusyError
 
 router = APIRouter(tags=["chat"], prefix="/chat", route_class=AutoDeriveResponsesAPIRoute)
 
 
 @router.post("/create_message")
-async def create_message(dialog_id: int = Body(...), message: str = Body(...)) -> ViewMessage:
+async def create_message(session: DbSession, dialog_id: int = Body(...), message: str = Body(...)) -> ViewMessage:
     """
     Create a new user message in a specified dialog.
     """
-    if await dialog_repository.get_dialog(dialog_id) is None:
+    # the dialog stays locked until the message is committed, so concurrent requests cannot both pass the check
+    dialog = await dialog_repository.lock_dialog(dialog_id, session)
+    if dialog is None:
         raise HTTPException(404, f"dialog {dialog_id} not found")
 
-    history = await messages_repository.get_all_dialog_messages(dialog_id)
-    last_message = history[-1] if history else None
-    if last_message and last_message.role == Roles.USER:
+    if dialog.last_role == Roles.USER:
         raise HTTPException(400, "last message is already a user message")
 
     created_message = CreateMessage(
@@ -28,43 +44,76 @@ async def create_message(dialog_id: int = Body(...), message: str = Body(...)) -
         role=Roles.USER,
         message=message,
     )
-    created = await messages_repository.create_message(created_message)
+    created = await messages_repository.create_message(created_message, session)
     return created
 
 
 @router.get("/chat_completion")
-async def chat_completion(dialog_id: int, model: Models) -> ViewMessage:
+async def chat_completion(session: DbSession, dialog_id: int, model: Models) -> ViewMessage:
     """
     Generate an AI response to the last user message in a dialog.
     """
-    if await dialog_repository.get_dialog(dialog_id) is None:
-        raise HTTPException(404, f"dialog {dialog_id} not found")
+    return await complete_dialog(session, dialog_id, model)
 
-    history = await messages_repository.get_all_dialog_messages(dialog_id)
-    last_message = history[-1] if history else None
-    if last_message and last_message.role != Roles.USER:
-        raise HTTPException(400, "last message is already an AI reply")
 
-    pipeline = ConditionalPipeline(
-        main_system_prompt=SYSTEM_PROMPT,
-        validation_prompt=VALIDATION_PROMPT,
-        validation_model=Models.LLAMA_3_3,
-        main_model=model,
-    )
-    assistant_content = await pipeline.run(
-        history=history,
-    )
+@router.get("/chat_completion_stream", response_class=StreamingResponse)
+async def chat_completion_stream(session: DbSession, dialog_id: int, model: Models) -> StreamingResponse:
+    """
+    Generate an AI response to the last user message in a dialog and stream it as server-sent events.
 
-    assistant_msg = CreateMessage(
-        dialog_id=dialog_id,
-        role=Roles.ASSISTANT,
-        message=assistant_content,
-        reply_to=last_message.id,
-        model=model,
+    Events: `delta` with `{"content": str}` for every chunk of the answer (`<think>` blocks are stripped),
+    `message` with the saved `ViewMessage`, `error` with `{"status_code": int, "detail": ...}`.
+    The answer is saved when the stream completes or the client disconnects. A partial answer cut by an error
+    is not saved, so the completion can be retried.
+    """
+    history = await dialog_repository.get_history(dialog_id, session)
+    await session.commit()
+    last_message = user_message_to_answer(dialog_id, history)
+
+    window = await compact_history(dialog_id, history, [Models.LLAMA_3_3, model])
+    pipeline = make_pipeline(model, window.summary)
+
+    async def events() -> AsyncIterator[str]:
+        stripper = ThinkStripper()
+        content: list[str] = []
+        failed = False
+        try:
+            async for delta in pipeline.run_stream(history=window.messages):
+                content.append(delta)
+                visible = stripper.feed(delta)
+                if visible:
+                    yield sse("delta", {"content": visible})
+            rest = stripper.flush()
+            if rest:
+                yield sse("delta", {"content": rest})
+        except (HTTPException, UpstreamBusyError, httpx.TransportError) as e:
+            failed = True
+            status_code, detail = error_response(e)
+            yield sse("error", {"status_code": status_code, "detail": detail})
+        except Exception:
+            failed = True
+            logger.exception(f"Failed to stream the answer in dialog {dialog_id}")
+            yield sse("error", {"status_code": 500, "detail": "Internal Server Error"})
+        finally:
+            saved_assistant = None
+            if content and not failed:
+                assistant_msg = CreateMessage(
+                    dialog_id=dialog_id,
+                    role=Roles.ASSISTANT,
+                    message="".join(content),
+                    reply_to=last_message.id if last_message else None,
+                    model=pipeline.used_model or model,
+                )
+                # the client may have disconnected, the answer must be saved anyway;
+                # the request session is closed before the body is streamed, so a new one is used
+                with anyio.CancelScope(shield=True):
+                    saved_assistant = await messages_repository.create_message(assistant_msg)
+        if saved_assistant is not None:
+            yield sse("message", saved_assistant.model_dump_json())
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    saved_assistant = await messages_repository.create_message(assistant_msg)
-
-    return ViewMessage.model_validate(saved_assistant)
 
 
 @router.get("/get_history", deprecated=True)
@@ -73,7 +122,7 @@ async def get_messages(dialog_id: int, amount: int = 0) -> list[ViewMessage]:
     Get n last messages from dialog. To get all messages, set amount to 0.
     NOTE: that endpoint is deprecated and left for compatibility. Consider using `/dialog/get_history` instead.
     """
-    if await dialog_repository.get_dialog(dialog_id) is None:
+    if not await dialog_repository.exists(dialog_id):
         raise HTTPException(404, f"dialog {dialog_id} not found")
 
     if amount == 0:
@@ -85,51 +134,21 @@ async def get_messages(dialog_id: int, amount: int = 0) -> list[ViewMessage]:
 
 
 @router.delete("/delete_message")
-async def delete_message(message_id: int) -> ViewMessage:
+async def delete_message(session: DbSession, message_id: int) -> ViewMessage:
     """
     Delete a user message by its ID.
     """
-    message = await messages_repository.get_message_by_id(message_id)
+    message = await messages_repository.get_message_by_id(message_id, session)
     if not message:
         raise HTTPException(404, f"message {message_id} not found")
     if message.role != Roles.USER:
         raise HTTPException(400, "You can only delete messages from user")
-    return await messages_repository.delete_message(message_id)
+    return await messages_repository.delete_message(message_id, session)
 
 
 @router.post("/regenerate")
-async def regenerate_response(message_id: int) -> ViewMessage:
+async def regenerate_response(session: DbSession, message_id: int) -> ViewMessage:
     """
     Regenerate an AI response for a given message ID.
     """
-    response = await messages_repository.get_message_by_id(message_id)
-    if response is None:
-        raise HTTPException(404, f"Message not found: {message_id}")
-
-    request = await messages_repository.get_request(message_id)
-    if request is None:
-        raise HTTPException(400, "message is not response")
-
-    await messages_repository.delete_message(message_id)
-
-    history = await messages_repository.get_all_dialog_messages(request.dialog_id)
-
-    pipeline = ConditionalPipeline(
-        main_system_prompt=SYSTEM_PROMPT,
-        validation_prompt=VALIDATION_PROMPT,
-        validation_model=Models.LLAMA_3_3,
-        main_model=response.model,
-    )
-    assistant_content = await pipeline.run(
-        history=history,
-    )
-
-    assistant_msg = CreateMessage(
-        dialog_id=request.dialog_id,
-        role=Roles.ASSISTANT,
-        message=assistant_content,
-        model=response.model,
-        reply_to=request.id,
-    )
-    saved_assistant = await messages_repository.create_message(assistant_msg)
-    return ViewMessage.model_validate(saved_assistant)
+    return await regenerate_answer(session, message_id)
@@ -0,0 +1,20 @@
+__all__ = ["DbSession", "get_session"]
+
+from collections.abc import AsyncIterator
+from typing import Annotated
+
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def get_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    Database session shared by the repository calls of one request (unit of work).
+    The connection is taken from the pool on the first query and returned on commit or at the end of the request,
+    uncommitted changes are rolled back.
+    """
+    async with request.app.state.storage.create_session() as session:
+        yield session
+
+
+DbSession = Annotated[AsyncSession, Depends(get_session)]
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from fastapi_derive_responses import AutoDeriveResponsesAPIRoute
 
-from src.db.repositories import dialog_repository
-from src.schemas import ViewDialog, ViewMessage
+from src.db.repositories import dialog_repository, messages_repository
+from src.schemas import DialogsPage, MessagesPage, ViewDialog, ViewMessage
 
 router = APIRouter(tags=["dialog"], prefix="/dialog", route_class=AutoDeriveResponsesAPIRoute)
 
@@ -27,10 +27,22 @@ async def get_dialog(dialog_id: int) -> ViewDialog:
     return dialog
 
 
-@router.get("/get_existing")
+@router.get("/list")
+async def list_dialogs(cursor: str | None = None, limit: int = Query(20, ge=1, le=100)) -> DialogsPage:
+    """
+    Get a page of dialog summaries, recently updated first. To load the next page pass `cursor` = `next_cursor` of the last loaded page.
+    """
+    try:
+        return await dialog_repository.list_dialogs(limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(400, f"invalid cursor: {cursor}")
+
+
+@router.get("/get_existing", deprecated=True)
 async def get_existing() -> list[ViewDialog]:
     """
     Get all existing dialogs.
+    NOTE: that endpoint is deprecated and left for compatibility. Consider using `/dialog/list` instead.
     """
     dialogs = await dialog_repository.get_all_dialogs()
     return dialogs
@@ -41,7 +53,7 @@ async def get_history(dialog_id: int, amount: int | None = None) -> list[ViewMes
     """
     Get n last messages from dialog. Leave amount None to get all messages.
     """
-    if await dialog_repository.get_dialog(dialog_id) is None:
+    if not await dialog_repository.exists(dialog_id):
         raise HTTPException(404, f"dialog {dialog_id} not found")
 
     messages = await dialog_repository.get_dialog_messages(dialog_id, amount)
@@ -49,6 +61,23 @@ async def get_history(dialog_id: int, amount: int | None = None) -> list[ViewMes
     return messages
 
 
+@router.get("/get_history_page")
+async def get_history_page(
+    dialog_id: int,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+) -> MessagesPage:
+    """
+    Get a page of messages from dialog, oldest first. Without cursors, the latest messages are returned.
+    To load older messages pass `before_id` = id of the first loaded message, to load newer ones pass `after_id`.
+    """
+    if not await dialog_repository.exists(dialog_id):
+        raise HTTPException(404, f"dialog {dialog_id} not found")
+
+    return await messages_repository.get_messages_page(dialog_id, limit, before_id=before_id, after_id=after_id)
+
+
 @router.delete("/delete_dialog")
 async def delete_dialog(dialog_id: int) -> ViewDialog:
     """
@@ -0,0 +1,165 @@
+__all__ = ["CompletionJobs"]
+
+import asyncio
+import itertools
+
+from src.api.chat.completion import complete_dialog, error_response, regenerate_answer
+from src.api.logging_ import logger
+from src.config import api_settings
+from src.db import AbstractSQLAlchemyStorage
+from src.db.repositories import jobs_repository
+from src.schemas import JobError, JobKind, JobPoolStats, ViewJob, ViewMessage
+
+CLEANUP_INTERVAL = 3600.0
+"Time in seconds between deletions of old finished jobs"
+
+
+class CompletionJobs:
+    """
+    Pool of workers running completion jobs of the current worker process. Created in the application lifespan.
+
+    Jobs are stored in the database, so any worker process can report their state, and run by the process that
+    accepted them: up to `job_workers` at once, higher priority first, then in the order of submission.
+    A job runs to the end whatever happens to the client that submitted it.
+    """
+
+    _storage: AbstractSQLAlchemyStorage | None = None
+    _queue: asyncio.PriorityQueue[tuple[int, int, float, ViewJob]]
+    _workers: list[asyncio.Task] = []
+    _running: set[int] = set()
+    _finished: dict[int, asyncio.Event] = {}
+    _order = itertools.count()
+    _stats: JobPoolStats
+    _cleaned_at = 0.0
+
+    @classmethod
+    def init(cls, storage: AbstractSQLAlchemyStorage) -> None:
+        """
+        Start the workers
+        """
+        cls._storage = storage
+        cls._queue = asyncio.PriorityQueue(maxsize=api_settings.job_max_queue)
+        cls._running = set()
+        cls._finished = {}
+        cls._stats = JobPoolStats(workers=api_settings.job_workers, max_queue=api_settings.job_max_queue)
+        cls._workers = [asyncio.create_task(cls._work()) for _ in range(api_settings.job_workers)]
+
+    @classmethod
+    def is_initialized(cls) -> bool:
+        return cls._storage is not None
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        Stop the workers, jobs that are not finished yet are failed
+        """
+        # running jobs are taken before the cancellation, their workers forget them on the way out
+        unfinished = list(cls._running)
+        for worker in cls._workers:
+            worker.cancel()
+        await asyncio.gather(*cls._workers, return_exceptions=True)
+        while not cls._queue.empty():
+            unfinished.append(cls._queue.get_nowait()[3].id)
+        if unfinished:
+            logger.warning(f"{len(unfinished)} completion jobs are failed on shutdown")
+            await jobs_repository.fail_unfinished(unfinished, JobError(status_code=503, detail="Server shut down"))
+        cls._workers = []
+        cls._storage = None
+
+    @classmethod
+    def submit(cls, job: ViewJob) -> None:
+        """
+        Queue the job. Raises `asyncio.QueueFull` if there are `job_max_queue` queued jobs.
+        """
+        if cls._storage is None:
+            raise RuntimeError("Completion jobs not initialized. Call CompletionJobs.init() first.")
+        try:
+            cls._queue.put_nowait((-job.priority, next(cls._order), asyncio.get_running_loop().time(), job))
+        except asyncio.QueueFull:
+            cls._stats.rejected += 1
+            raise
+        cls._finished[job.id] = asyncio.Event()
+        cls._stats.submitted += 1
+
+    @classmethod
+    async def wait(cls, job_id: int, timeout: float) -> None:
+        """
+        Wait until the job finishes or the timeout passes. Jobs of other worker processes are not tracked,
+        for them it is just a sleep.
+        """
+        finished = cls._finished.get(job_id)
+        if finished is None:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait_for(finished.wait(), timeout)
+        except TimeoutError:
+            pass
+
+    @classmethod
+    async def _work(cls) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, queued_at, job = await cls._queue.get()
+            waited = loop.time() - queued_at
+            cls._stats.wait_seconds_total += waited
+            cls._stats.max_wait_seconds = max(cls._stats.max_wait_seconds, waited)
+            cls._running.add(job.id)
+            try:
+                await cls._run(job)
+            except Exception:
+                # the database is unavailable, the job stays unfinished but the worker goes on
+                logger.exception(f"Failed to update the state of completion job {job.id}")
+            finally:
+                cls._running.discard(job.id)
+                finished = cls._finished.pop(job.id, None)
+                if finished is not None:
+                    finished.set()
+            if loop.time() - cls._cleaned_at > CLEANUP_INTERVAL:
+                cls._cleaned_at = loop.time()
+                await cls._cleanup()
+
+    @classmethod
+    async def _run(cls, job: ViewJob) -> None:
+        if not await jobs_repository.set_running(job.id):
+            # waited in the queue for longer than `job_timeout` and was failed as lost
+            cls._stats.failed += 1
+            return
+        try:
+            async with cls._storage.create_session() as session:
+                if job.kind == JobKind.COMPLETION:
+                    answer: ViewMessage = await complete_dialog(session, job.dialog_id, job.model, job.message_id)
+                else:
+                    answer = await regenerate_answer(session, job.message_id)
+        except Exception as e:
+            response = error_response(e)
+            if response is None:
+                logger.exception(f"Completion job {job.id} failed")
+                response = 500, "Internal Server Error"
+            cls._stats.failed += 1
+            await jobs_repository.set_failed(job.id, JobError(status_code=response[0], detail=response[1]))
+            return
+        cls._stats.succeeded += 1
+        await jobs_repository.set_succeeded(job.id, answer.id)
+
+    @classmethod
+    async def _cleanup(cls) -> None:
+        try:
+            deleted = await jobs_repository.delete_finished(api_settings.job_retention)
+        except Exception:
+            logger.exception("Failed to delete old completion jobs")
+            return
+        if deleted:
+            logger.info(f"Deleted {deleted} finished completion jobs older than {api_settings.job_retention} s")
+
+    @classmethod
+    def stats(cls) -> JobPoolStats:
+        """
+        Get a snapshot of the queue and job counters
+        """
+        if cls._storage is None:
+            raise RuntimeError("Completion jobs not initialized. Call CompletionJobs.init() first.")
+        snapshot = cls._stats.model_copy()
+        snapshot.running = len(cls._running)
+        snapshot.queued = cls._queue.qsize()
+        return snapshot
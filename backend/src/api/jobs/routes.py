@@ -0,0 +1,111 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from fastapi_derive_responses import AutoDeriveResponsesAPIRoute
+
+from src.api.chat.completion import sse, user_message_to_answer
+from src.api.dependencies import DbSession
+from src.api.jobs.pool import CompletionJobs
+from src.config import api_settings
+from src.db.repositories import dialog_repository, jobs_repository, messages_repository
+from src.schemas import JobError, JobKind, ViewJob
+from src.schemas.chat import Models
+
+router = APIRouter(tags=["jobs"], prefix="/jobs", route_class=AutoDeriveResponsesAPIRoute)
+
+
+async def _submit(job: ViewJob) -> ViewJob:
+    try:
+        CompletionJobs.submit(job)
+    except asyncio.QueueFull:
+        detail = "Too many queued completion jobs"
+        await jobs_repository.set_failed(job.id, JobError(status_code=503, detail=detail))
+        raise HTTPException(503, detail)
+    return job
+
+
+@router.post("/chat_completion", status_code=202)
+async def enqueue_chat_completion(
+    session: DbSession, dialog_id: int, model: Models, priority: int = Query(0, ge=0, le=10)
+) -> ViewJob:
+    """
+    Queue generation of an AI response to the last user message in a dialog, jobs with higher priority run first.
+    If the dialog already has an unfinished job, that job is returned.
+    """
+    history = await dialog_repository.get_history(dialog_id, session)
+    await session.commit()
+    last_message = user_message_to_answer(dialog_id, history)
+
+    created_job = await jobs_repository.create_job(
+        dialog_id, JobKind.COMPLETION, model, last_message.id if last_message else None, priority
+    )
+    if created_job is None:
+        raise HTTPException(404, f"dialog {dialog_id} not found")
+    job, created = created_job
+    return await _submit(job) if created else job
+
+
+@router.post("/regenerate", status_code=202)
+async def enqueue_regenerate(session: DbSession, message_id: int, priority: int = Query(0, ge=0, le=10)) -> ViewJob:
+    """
+    Queue regeneration of an AI response for a given message ID, jobs with higher priority run first.
+    If the dialog already has an unfinished job, that job is returned.
+    """
+    response = await messages_repository.get_message_by_id(message_id, session)
+    if response is None:
+        raise HTTPException(404, f"Message not found: {message_id}")
+    if await messages_repository.get_request(message_id, session) is None:
+        raise HTTPException(400, "message is not response")
+    await session.commit()
+
+    created_job = await jobs_repository.create_job(
+        response.dialog_id, JobKind.REGENERATE, response.model, message_id, priority
+    )
+    if created_job is None:
+        raise HTTPException(404, f"dialog {response.dialog_id} not found")
+    job, created = created_job
+    return await _submit(job) if created else job
+
+
+@router.get("/get_job")
+async def get_job(job_id: int) -> ViewJob:
+    """
+    Get the state of a job, with the saved answer once it has succeeded.
+    """
+    job = await jobs_repository.get_job(job_id)
+    if job is None:
+        raise HTTPException(404, f"job {job_id} not found")
+    return job
+
+
+@router.get("/subscribe", response_class=StreamingResponse)
+async def subscribe(job_id: int) -> StreamingResponse:
+    """
+    Stream the state of a job as server-sent events until it finishes.
+
+    Events: `job` with the `ViewJob` on every status change, the last one has the answer or the error.
+    The job goes on if the client disconnects.
+    """
+    job = await jobs_repository.get_job(job_id)
+    if job is None:
+        raise HTTPException(404, f"job {job_id} not found")
+
+    async def events() -> AsyncIterator[str]:
+        current = job
+        yield sse("job", current.model_dump_json())
+        while not current.finished:
+            await CompletionJobs.wait(job_id, api_settings.job_poll_interval)
+            status = current.status
+            current = await jobs_repository.get_job(job_id)
+            if current is None:
+                # the dialog was deleted with its jobs
+                yield sse("error", {"status_code": 404, "detail": f"job {job_id} not found"})
+                return
+            if current.status != status:
+                yield sse("job", current.model_dump_json())
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
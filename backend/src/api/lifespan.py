@@ -3,26 +3,41 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
 import src.api.logging_  # noqa: F401
+from src.api.jobs.pool import CompletionJobs
 from src.config import api_settings
 from src.db import SQLAlchemyStorage
 from src.rag import VectorRetriever
+from src.upstream import MwsClient, UpstreamLimiter
 
 
 async def setup_repositories() -> SQLAlchemyStorage:
-    from src.db.repositories import dialog_repository, messages_repository
+    from src.db.repositories import dialog_repository, jobs_repository, messages_repository
 
-    storage = SQLAlchemyStorage.from_url(api_settings.db_url.get_secret_value())
+    storage = SQLAlchemyStorage.from_url(
+        api_settings.db_url.get_secret_value(),
+        pool_size=api_settings.db_pool_size,
+        max_overflow=api_settings.db_max_overflow,
+    )
     dialog_repository.update_storage(storage)
     messages_repository.update_storage(storage)
+    jobs_repository.update_storage(storage)
 
     return storage
 
 
 @asynccontextmanager
-async def lifespan(_app: FastAPI):
+async def lifespan(app: FastAPI):
     # Application startup
     storage = await setup_repositories()
-    VectorRetriever.init(api_settings.rag_index_path)
+    app.state.storage = storage
+    MwsClient.init()
+    UpstreamLimiter.init()
+    CompletionJobs.init(storage)
+    if not VectorRetriever.is_initialized():
+        # in the multi-worker mode the index is opened by the master process before fork
+        VectorRetriever.init(api_settings.rag_index_path)
     yield
     # Application shutdown
+    await CompletionJobs.close()
+    await MwsClient.close()
     await storage.close_connection()
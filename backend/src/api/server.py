@@ -0,0 +1,36 @@
+"""
+Multi-worker entry point: `python -m src.api.server [GUNICORN OPTIONS]`.
+
+The prepare script runs once in the master process, the RAG index is opened before workers are forked,
+so they share its pages. Database and MWS GPT API connection pools are created by each worker in the lifespan.
+"""
+
+import os
+import sys
+
+from src.prepare import BASE_DIR, prepare
+
+os.chdir(BASE_DIR)
+prepare()
+
+from gunicorn.app.wsgiapp import run  # noqa: E402
+
+from src.config import api_settings  # noqa: E402
+from src.rag import VectorRetriever  # noqa: E402
+
+VectorRetriever.init(api_settings.rag_index_path)
+
+# Get arguments from command
+args = sys.argv[1:]
+extended_args = [
+    "src.api.app:app",
+    "--worker-class=uvicorn.workers.UvicornWorker",
+    f"--workers={api_settings.workers}",
+    "--preload",
+    "--forwarded-allow-ips=*",
+    *args,
+]
+
+print(f"🚀 Starting Gunicorn server: 'gunicorn {' '.join(extended_args)}'")
+sys.argv = ["gunicorn", *extended_args]
+run()
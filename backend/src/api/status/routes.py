@@ -0,0 +1,94 @@
+from fastapi import APIRouter
+from fastapi_derive_responses import AutoDeriveResponsesAPIRoute
+
+from src.api.chat.ai_service import ConditionalPipeline
+from src.api.chat.response_cache import response_cache as chat_response_cache
+from src.api.jobs.pool import CompletionJobs
+from src.db.repositories.history_cache import history_cache
+from src.rag import VectorRetriever
+from src.schemas import (
+    HistoryCacheStats,
+    JobPoolStats,
+    ResponseCacheStats,
+    RetrievalCacheStats,
+    RoutingStats,
+    SpeculationStats,
+    UpstreamLimiterStats,
+    UpstreamPoolStats,
+    UpstreamResilienceStats,
+)
+from src.upstream import CircuitBreaker, ModelRouter, MwsClient, UpstreamLimiter
+
+router = APIRouter(tags=["status"], prefix="/status", route_class=AutoDeriveResponsesAPIRoute)
+
+
+@router.get("/upstream_pool")
+async def upstream_pool() -> UpstreamPoolStats:
+    """
+    Get utilisation counters of the MWS GPT connection pool of the current worker.
+    """
+    return MwsClient.stats()
+
+
+@router.get("/upstream_limiter")
+async def upstream_limiter() -> UpstreamLimiterStats:
+    """
+    Get queue, wait time and 429 pacing counters of MWS GPT API requests of the current worker.
+    """
+    return UpstreamLimiter.stats()
+
+
+@router.get("/circuit_breakers")
+async def circuit_breakers() -> UpstreamResilienceStats:
+    """
+    Get the state, failure and retry counters of the per-model MWS GPT circuit breakers of the current worker.
+    """
+    return CircuitBreaker.all_stats()
+
+
+@router.get("/model_routing")
+async def model_routing() -> RoutingStats:
+    """
+    Get latency percentiles, reroutes and hedged calls of the models of the main generation of the current worker.
+    """
+    return ModelRouter.stats()
+
+
+@router.get("/retrieval_cache")
+async def retrieval_cache() -> RetrievalCacheStats:
+    """
+    Get hit/miss counters of the query embedding and search result caches of the current worker.
+    """
+    return VectorRetriever.cache_stats()
+
+
+@router.get("/speculation")
+async def speculation() -> SpeculationStats:
+    """
+    Get time saved and tokens wasted by speculative generation in the current worker.
+    """
+    return ConditionalPipeline.speculation_stats
+
+
+@router.get("/response_cache")
+async def response_cache() -> ResponseCacheStats:
+    """
+    Get hit/miss counters of the chat answer cache of the current worker.
+    """
+    return chat_response_cache.stats()
+
+
+@router.get("/history_cache")
+async def history_cache_stats() -> HistoryCacheStats:
+    """
+    Get hit ratio and memory size of the dialog history cache of the current worker.
+    """
+    return history_cache.stats()
+
+
+@router.get("/jobs")
+async def jobs() -> JobPoolStats:
+    """
+    Get queue, wait time and outcome counters of the completion jobs of the current worker.
+    """
+    return CompletionJobs.stats()
@@ -0,0 +1,96 @@
+__all__ = ["AsyncTTLCache"]
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from src.schemas.status import CacheStats
+
+_MISSING = object()
+
+
+class AsyncTTLCache:
+    """
+    Bounded in-process cache with LRU and TTL eviction.
+    Concurrent `get_or_create` calls for the same key share a single call of the factory.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._pending: dict[Hashable, asyncio.Task] = {}
+        self._stats = CacheStats(maxsize=maxsize)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: Hashable) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self._stats.expirations += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._lookup(key)
+        if value is _MISSING:
+            self._stats.misses += 1
+            return default
+        self._stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_create(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value or compute it with `factory`.
+        The factory runs in a separate task, so cancelling one of the waiting callers does not cancel the others.
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self._stats.hits += 1
+            return value
+
+        task = self._pending.get(key)
+        if task is not None:
+            self._stats.shared += 1
+        else:
+            self._stats.misses += 1
+            task = asyncio.ensure_future(factory())
+            self._pending[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.set(key, task.result())
+
+    def stats(self) -> CacheStats:
+        snapshot = self._stats.model_copy()
+        snapshot.size = len(self._data)
+        snapshot.in_flight = len(self._pending)
+        return snapshot
@@ -3,6 +3,9 @@ from pathlib import Path
 import yaml
 from pydantic import BaseModel, ConfigDict, Field, SecretStr
 
+from src.schemas.chat import Models
+from src.schemas.rag import IndexSpec
+
 
 class ApiSettings(BaseModel):
     app_root_path: str = Field("/api")
@@ -26,6 +29,128 @@ class ApiSettings(BaseModel):
     "Path to definition json pdf/docx/md documentation"
     rag_index_path: str = Field(..., example="data/vector.index")
     "Path to indexed documentation"
+    rag_index: IndexSpec = IndexSpec()
+    "Type and tuning parameters of the vector index, the index is rebuilt without embedding when they change"
+    workers: int = Field(1, ge=1)
+    "Number of worker processes started by the multi-worker entry point `python -m src.api.server`"
+    db_pool_size: int = Field(5, ge=1)
+    "Number of connections kept in the database connection pool (per worker)"
+    db_max_overflow: int = Field(10, ge=0)
+    "Number of connections opened above `db_pool_size` under load (per worker)"
+    mws_gpt_max_connections: int = Field(100, ge=1)
+    "Maximum number of simultaneous connections to MWS GPT API (per worker)"
+    mws_gpt_max_keepalive_connections: int = Field(20, ge=0)
+    "Maximum number of idle keep-alive connections to MWS GPT API kept in the pool (per worker)"
+    mws_gpt_keepalive_expiry: float = Field(30.0, ge=0)
+    "Time in seconds after which an idle keep-alive connection to MWS GPT API is closed"
+    mws_gpt_http2: bool = False
+    "Use HTTP/2 for MWS GPT API connections (requires `h2` package, falls back to HTTP/1.1 otherwise)"
+    upstream_max_concurrency: int = Field(16, ge=1)
+    "Maximum number of concurrent requests to one model and endpoint of MWS GPT API (per worker)"
+    upstream_concurrency_limits: dict[Models, int] = {}
+    "Per-model overrides of `upstream_max_concurrency`"
+    upstream_rate_limit: float | None = Field(None, gt=0)
+    "Maximum number of requests per second to one model and endpoint (per worker), null means no limit"
+    upstream_max_queue: int = Field(100, ge=0)
+    "Maximum number of requests waiting for one model and endpoint, further requests are rejected with 503"
+    upstream_queue_timeout: float | None = Field(30.0, gt=0)
+    "Time in seconds a request waits in the queue before it is rejected with 503, null means no limit"
+    upstream_default_retry_after: float = Field(1.0, gt=0)
+    "Time in seconds requests are paused after a 429 response without `Retry-After` header"
+    upstream_connect_timeout: float = Field(5.0, gt=0)
+    "Time in seconds to establish a connection to MWS GPT API"
+    upstream_read_timeout: float = Field(120.0, gt=0)
+    "Time in seconds MWS GPT API may stay silent: the whole answer of a non-streaming call or a gap in a stream"
+    upstream_total_timeout: float | None = Field(300.0, gt=0)
+    "Time in seconds one MWS GPT API call may take, retries and streaming included (null means no limit)"
+    upstream_max_retries: int = Field(2, ge=0)
+    "Number of retries of a MWS GPT API call after connection errors, timeouts, 429 and 5xx responses"
+    upstream_retry_backoff: float = Field(0.5, gt=0)
+    "Base delay in seconds of the jittered exponential backoff between retries"
+    upstream_breaker_failure_threshold: int = Field(5, ge=1)
+    "Number of consecutive failed attempts to call a model that opens its circuit breaker"
+    upstream_breaker_reset_timeout: float = Field(30.0, gt=0)
+    "Time in seconds an open circuit breaker fails calls fast before letting a trial call through"
+    routing_fallbacks: dict[Models, Models] = {}
+    "Fallback model of each main model, used when the model is slow"
+    routing_hedge_after: float | None = Field(None, gt=0)
+    "Time in seconds after which the main generation is also sent to the fallback model, null disables hedging"
+    routing_latency_slo: float | None = Field(None, gt=0)
+    "Latency SLO in seconds: while the recent p95 of a model exceeds it, calls go to the fallback (null disables it)"
+    routing_ewma_alpha: float = Field(0.2, gt=0, le=1)
+    "Weight of the latest call in the moving average of model latency"
+    routing_latency_window: float = Field(300.0, gt=0)
+    "Time in seconds the latency of a call counts towards the percentiles of the model"
+    routing_min_samples: int = Field(20, ge=1)
+    "Number of calls within the latency window needed before a model may be rerouted"
+    job_workers: int = Field(4, ge=1)
+    "Number of completion jobs run at once (per worker)"
+    job_max_queue: int = Field(100, ge=1)
+    "Maximum number of completion jobs waiting for a free job worker (per worker), further jobs are rejected with 503"
+    job_poll_interval: float = Field(1.0, gt=0)
+    "Time in seconds between state checks of a job run by another worker for subscribed clients"
+    job_timeout: float = Field(1800.0, gt=0)
+    "Time in seconds after which an unfinished job is failed as lost (its worker process was killed)"
+    job_retention: float = Field(86400.0, gt=0)
+    "Time in seconds finished completion jobs are kept in the database"
+    rag_cache_size: int = Field(1024, ge=0)
+    "Maximum number of cached query embeddings and search results (per worker, 0 disables caching)"
+    rag_cache_ttl: float | None = Field(3600, gt=0)
+    "Time in seconds cached query embeddings and search results live, null means no expiration"
+    speculative_generation: bool = False
+    "Call the main model concurrently with the validation model, discarding the answer if validation fails"
+    rag_embedding_batch_size: int = Field(100, ge=1)
+    "Maximum number of chunks embedded by one request when building the index"
+    rag_embedding_concurrency: int = Field(4, ge=1)
+    "Number of embedding requests sent concurrently when building the index"
+    rag_embedding_max_retries: int = Field(5, ge=0)
+    "Number of retries of a failed embedding request when building the index"
+    rag_top_k: int = Field(25, ge=1)
+    "Number of chunks retrieved for a prompt"
+    rag_mmr_lambda: float | None = Field(0.7, ge=0, le=1)
+    "Trade-off between relevance (1) and diversity (0) of retrieved chunks, null disables MMR re-ranking"
+    rag_mmr_fetch_k: int = Field(50, ge=1)
+    "Number of candidate chunks MMR re-ranking selects from"
+    rag_lexical_search: bool = True
+    "Fuse vector search results with BM25 lexical search results by reciprocal rank fusion"
+    rag_rrf_k: int = Field(60, ge=1)
+    "Constant of reciprocal rank fusion, larger values give less weight to top ranks"
+    rag_embedding_timeout: float | None = Field(3.0, gt=0)
+    "Time in seconds to wait for the query embedding, then lexical search results are used alone (null to wait forever)"
+    rag_context_token_budget: int | None = Field(16000, gt=0)
+    "Maximum estimated number of tokens of documentation context in a prompt, null means no limit"
+    rag_context_token_budgets: dict[Models, int] = {}
+    "Per-model overrides of `rag_context_token_budget`"
+    response_cache_size: int = Field(256, ge=0)
+    "Maximum number of cached chat answers (per worker, 0 disables caching)"
+    response_cache_ttl: float | None = Field(3600, gt=0)
+    "Time in seconds cached chat answers live, null means no expiration"
+    response_cache_similarity_threshold: float | None = Field(None, gt=0, le=1)
+    "Minimal cosine similarity of the last user messages to reuse a cached answer, null disables near-duplicate hits"
+    response_cache_disabled_models: list[Models] = []
+    "Models whose answers are never cached"
+    dialog_history_cache_size: int = Field(1024, ge=0)
+    "Maximum number of cached dialog histories (per worker, 0 disables caching)"
+    history_token_budget: int | None = Field(8000, gt=0)
+    "Maximum estimated number of tokens of dialog history in a prompt, older turns are summarised (null means no limit)"
+    history_token_budgets: dict[Models, int] = {}
+    "Per-model overrides of `history_token_budget`"
+    history_summary_model: Models = Models.LLAMA_3_1
+    "Model that summarises the turns left out of the prompt"
+    history_summary_token_budget: int = Field(1000, ge=1)
+    "Approximate maximum number of tokens of the summary, reserved within `history_token_budget`"
+
+    def context_token_budget(self, model: Models) -> int | None:
+        """
+        Token budget of documentation context for the model.
+        """
+        return self.rag_context_token_budgets.get(model, self.rag_context_token_budget)
+
+    def history_budget(self, model: Models) -> int | None:
+        """
+        Token budget of dialog history for the model.
+        """
+        return self.history_token_budgets.get(model, self.history_token_budget)
 
 
 class Settings(BaseModel):
@@ -1,5 +1,6 @@
 from src.db.models.base import Base
+from src.db.models.completion_job import CompletionJob
 from src.db.models.dialog import Dialog
 from src.db.models.message import Message
 
-__all__ = ["Base", "Dialog", "Message"]
+__all__ = ["Base", "Dialog", "Message", "CompletionJob"]
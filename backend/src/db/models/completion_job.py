@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import JSON, ForeignKey, Index, func, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.db.__mixin__ import IdMixin
+from src.db.models import Base
+
+
+class CompletionJob(Base, IdMixin):
+    __tablename__ = "completion_job"
+    __table_args__ = (
+        Index("ix_completion_job_dialog_id_status", "dialog_id", "status"),
+        # a dialog has at most one unfinished job
+        Index(
+            "uq_completion_job_dialog_id_unfinished",
+            "dialog_id",
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    dialog_id: Mapped[int] = mapped_column(ForeignKey("dialog.id", ondelete="CASCADE"), nullable=False)
+    kind: Mapped[str] = mapped_column(nullable=False)
+    model: Mapped[str | None] = mapped_column(nullable=True)
+    message_id: Mapped[int | None] = mapped_column(nullable=True)
+    "User message to answer, or the answer to regenerate"
+    priority: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
+    status: Mapped[str] = mapped_column(nullable=False)
+    # no foreign key, the job outlives the deletion of its answer
+    result_message_id: Mapped[int | None] = mapped_column(nullable=True)
+    error: Mapped[dict[str, Any] | None] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
+    started_at: Mapped[datetime | None] = mapped_column(nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(nullable=True)
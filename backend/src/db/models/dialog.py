@@ -1,6 +1,8 @@
+from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy.orm import Mapped, relationship
+from sqlalchemy import Index, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.db.__mixin__ import IdMixin
 from src.db.models import Base
@@ -11,10 +13,26 @@ if TYPE_CHECKING:
 
 class Dialog(Base, IdMixin):
     __tablename__ = "dialog"
+    __table_args__ = (Index("ix_dialog_updated_at_id", "updated_at", "id"),)
+
+    # state of the dialog, maintained by the messages repository in the transaction that changes the messages
+    # (no foreign key to the message, that would make the tables reference each other)
+    last_message_id: Mapped[int | None] = mapped_column(nullable=True)
+    last_role: Mapped[str | None] = mapped_column(nullable=True)
+    message_count: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
+    updated_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
+    version: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
+    "Incremented on every change of the messages, cached histories are validated against it"
+    summary: Mapped[str | None] = mapped_column(nullable=True)
+    "Rolling summary of the turns left out of prompts"
+    summary_until_id: Mapped[int | None] = mapped_column(nullable=True)
+    "ID of the last message covered by the summary"
 
     messages: Mapped[list["Message"]] = relationship(
         "Message",
         back_populates="dialog",
         cascade="all, delete-orphan",
-        lazy="joined",
+        order_by="Message.id",
+        passive_deletes=True,
+        lazy="raise",
     )
@@ -1,6 +1,6 @@
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.db.__mixin__ import IdMixin
@@ -12,6 +12,7 @@ if TYPE_CHECKING:
 
 class Message(Base, IdMixin):
     __tablename__ = "message"
+    __table_args__ = (Index("ix_message_dialog_id_id", "dialog_id", "id"),)
 
     dialog_id: Mapped[int] = mapped_column(ForeignKey("dialog.id", ondelete="CASCADE"), nullable=False)
     role: Mapped[str] = mapped_column(nullable=False)
@@ -26,7 +27,7 @@ class Message(Base, IdMixin):
         back_populates="reply",
         remote_side="Message.id",
         foreign_keys=[reply_to],
-        lazy="joined",
+        lazy="raise",
     )
 
     reply: Mapped["Message"] = relationship(
@@ -36,11 +37,11 @@ class Message(Base, IdMixin):
         foreign_keys=[reply_to],
         uselist=False,
         passive_deletes=True,
-        lazy="joined",
+        lazy="raise",
     )
 
     dialog: Mapped["Dialog"] = relationship(
         "Dialog",
         back_populates="messages",
-        lazy="joined",
+        lazy="raise",
     )
@@ -1,4 +1,5 @@
 from src.db.repositories.dialog_repository import dialog_repository
+from src.db.repositories.jobs_repository import jobs_repository
 from src.db.repositories.messages_repository import messages_repository
 
-__all__ = ["messages_repository", "dialog_repository"]
+__all__ = ["messages_repository", "dialog_repository", "jobs_repository"]
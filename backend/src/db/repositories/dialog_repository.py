@@ -1,11 +1,32 @@
+import base64
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Self
 
-from sqlalchemy import insert, select
+from sqlalchemy import Select, and_, delete, exists, func, insert, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from src.db import AbstractSQLAlchemyStorage
-from src.db.models import Dialog
-from src.schemas import ViewDialog, ViewMessage
+from src.db.models import Dialog, Message
+from src.db.repositories.history_cache import history_cache
+from src.schemas import DialogsPage, DialogSummary, ViewDialog, ViewMessage
+
+PREVIEW_LENGTH = 100
+"Number of characters of the last message in a dialog summary"
+
+
+def _encode_cursor(updated_at: datetime, dialog_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()}|{dialog_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        updated_at, dialog_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(updated_at), int(dialog_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
 
 
 class DialogRepository:
@@ -18,6 +39,17 @@ class DialogRepository:
     def _create_session(self) -> AsyncSession:
         return self.storage.create_session()
 
+    @asynccontextmanager
+    async def _use_session(self, session: AsyncSession | None) -> AsyncIterator[AsyncSession]:
+        """
+        Use the session of the request if it is given, otherwise a new one.
+        """
+        if session is not None:
+            yield session
+            return
+        async with self._create_session() as session:
+            yield session
+
     async def create_dialog(self) -> ViewDialog:
         async with self._create_session() as session:
             query = insert(Dialog).values().returning(Dialog.id)
@@ -27,39 +59,145 @@ class DialogRepository:
             await session.commit()
             return created_dialog
 
+    async def exists(self, dialog_id: int, session: AsyncSession | None = None) -> bool:
+        async with self._use_session(session) as session:
+            return await session.scalar(select(exists().where(Dialog.id == dialog_id)))
+
     async def get_dialog(self, dialog_id: int) -> ViewDialog | None:
         async with self._create_session() as session:
-            query = select(Dialog).where(Dialog.id == dialog_id)
+            query = select(Dialog).options(selectinload(Dialog.messages)).where(Dialog.id == dialog_id)
             obj = await session.scalar(query)
             if obj is not None:
                 return ViewDialog.model_validate(obj)
             return None
 
+    async def lock_dialog(self, dialog_id: int, session: AsyncSession) -> DialogSummary | None:
+        """
+        Read the state of the dialog and lock its row until the end of the transaction, in one statement.
+        Concurrent requests to the same dialog wait, so turn checks and the following write are consistent.
+        """
+        query = self._summaries().where(Dialog.id == dialog_id).with_for_update(of=Dialog)
+        row = (await session.execute(query)).one_or_none()
+        if row is None:
+            return None
+        return DialogSummary.model_validate(row, from_attributes=True)
+
+    async def get_history(self, dialog_id: int, session: AsyncSession | None = None) -> list[ViewMessage] | None:
+        """
+        All messages of the dialog, oldest first, or None if there is no such dialog.
+        A cached history costs a single-row version check, otherwise the messages are read by one statement.
+        """
+        async with self._use_session(session) as session:
+            cached = history_cache.get(dialog_id)
+            if cached is not None:
+                version = await session.scalar(select(Dialog.version).where(Dialog.id == dialog_id))
+                if history_cache.validate(dialog_id, cached, version):
+                    return list(cached.messages)
+                if version is None:
+                    return None
+
+            query = (
+                select(Dialog.version, Message)
+                .outerjoin(Message, Message.dialog_id == Dialog.id)
+                .where(Dialog.id == dialog_id)
+                .order_by(Message.id)
+            )
+            rows = (await session.execute(query)).all()
+            if not rows:
+                return None
+            messages = [ViewMessage.model_validate(obj) for _, obj in rows if obj is not None]
+            history_cache.set(dialog_id, rows[0][0], messages)
+            return messages
+
+    async def get_summary(self, dialog_id: int) -> tuple[str | None, int | None]:
+        """
+        Rolling summary of the dialog and the ID of the last message it covers.
+        """
+        async with self._create_session() as session:
+            row = (
+                await session.execute(select(Dialog.summary, Dialog.summary_until_id).where(Dialog.id == dialog_id))
+            ).one_or_none()
+            return (row.summary, row.summary_until_id) if row is not None else (None, None)
+
+    async def save_summary(self, dialog_id: int, summary: str, until_id: int) -> None:
+        """
+        Store the summary unless a concurrent request has already stored one covering more messages.
+        """
+        async with self._create_session() as session:
+            await session.execute(
+                update(Dialog)
+                .where(
+                    Dialog.id == dialog_id,
+                    or_(Dialog.summary_until_id.is_(None), Dialog.summary_until_id < until_id),
+                )
+                .values(summary=summary, summary_until_id=until_id)
+            )
+            await session.commit()
+
     async def get_all_dialogs(self) -> list[ViewDialog]:
         async with self._create_session() as session:
-            query = select(Dialog)
-            result = await session.execute(query)
-            objs = result.unique().scalars().all()
-        return [ViewDialog.model_validate(obj) for obj in objs]
+            query = select(Dialog).options(selectinload(Dialog.messages)).order_by(Dialog.id)
+            objs = await session.scalars(query)
+            return [ViewDialog.model_validate(obj) for obj in objs]
+
+    @staticmethod
+    def _summaries() -> Select:
+        """
+        Dialog summaries from the dialog state columns, the preview is read from the last message by primary key.
+        """
+        return select(
+            Dialog.id,
+            Dialog.message_count,
+            Dialog.last_message_id,
+            Dialog.last_role,
+            func.substr(Message.message, 1, PREVIEW_LENGTH).label("last_message_preview"),
+            Dialog.updated_at,
+        ).outerjoin(Message, Message.id == Dialog.last_message_id)
+
+    async def list_dialogs(self, limit: int, cursor: str | None = None) -> DialogsPage:
+        """
+        Page of dialog summaries, recently updated first: up to `limit` dialogs after the `cursor` of the previous page.
+        Keyset pagination by the (updated_at, id) index. The cursor carries both values, so a page does not move
+        when the last dialog of the previous page is updated or deleted. Raises `ValueError` for a malformed cursor.
+        """
+        async with self._create_session() as session:
+            query = self._summaries().order_by(Dialog.updated_at.desc(), Dialog.id.desc())
+            if cursor is not None:
+                updated_at, dialog_id = _decode_cursor(cursor)
+                query = query.where(
+                    or_(Dialog.updated_at < updated_at, and_(Dialog.updated_at == updated_at, Dialog.id < dialog_id))
+                )
+            # one extra row tells whether there is a next page
+            rows = (await session.execute(query.limit(limit + 1))).all()
+            dialogs = [DialogSummary.model_validate(row, from_attributes=True) for row in rows[:limit]]
+            has_more = len(rows) > limit
+            next_cursor = _encode_cursor(dialogs[-1].updated_at, dialogs[-1].id) if has_more else None
+            return DialogsPage(dialogs=dialogs, has_more=has_more, next_cursor=next_cursor)
 
     async def get_dialog_messages(self, dialog_id: int, amount: int | None = None) -> list[ViewMessage] | None:
         async with self._create_session() as session:
-            obj = await session.get(Dialog, dialog_id)
-            if obj is None:
+            if not await session.scalar(select(exists().where(Dialog.id == dialog_id))):
                 return None
-            messages = [ViewMessage.model_validate(obj) for obj in obj.messages]
-            if amount is not None:
-                messages = messages[:amount]
-            return messages
+            if amount is None:
+                query = select(Message).where(Message.dialog_id == dialog_id).order_by(Message.id)
+                return [ViewMessage.model_validate(obj) for obj in await session.scalars(query)]
+            query = select(Message).where(Message.dialog_id == dialog_id).order_by(Message.id.desc()).limit(amount)
+            objs = await session.scalars(query)
+            return [ViewMessage.model_validate(obj) for obj in reversed(objs.all())]
 
     async def delete_dialog(self, dialog_id: int) -> ViewDialog | None:
         async with self._create_session() as session:
-            obj = await session.get(Dialog, dialog_id)
+            query = select(Dialog).options(selectinload(Dialog.messages)).where(Dialog.id == dialog_id)
+            obj = await session.scalar(query)
             if obj is None:
                 return None
-            await session.delete(obj)
+            deleted = ViewDialog.model_validate(obj)
+            # bulk deletes, the unit of work would otherwise walk the relationships of every message
+            await session.execute(delete(Message).where(Message.dialog_id == dialog_id))
+            await session.execute(delete(Dialog).where(Dialog.id == dialog_id))
             await session.commit()
-            return ViewDialog.model_validate(obj)
+            history_cache.invalidate(dialog_id)
+            return deleted
 
 
 dialog_repository: DialogRepository = DialogRepository()
@@ -0,0 +1,116 @@
+__all__ = ["CachedHistory", "DialogHistoryCache", "history_cache"]
+
+import sys
+from collections import OrderedDict
+from typing import NamedTuple
+
+from src.config import api_settings
+from src.schemas import HistoryCacheStats, ViewMessage
+
+
+class CachedHistory(NamedTuple):
+    version: int
+    "Version of the dialog the messages were read at"
+    messages: tuple[ViewMessage, ...]
+    size: int
+    "Estimated memory size of the messages in bytes"
+
+
+def _message_size(message: ViewMessage) -> int:
+    return sys.getsizeof(message) + sys.getsizeof(message.message)
+
+
+class DialogHistoryCache:
+    """
+    Bounded LRU cache of dialog histories of the current worker, keyed by the dialog id.
+
+    Every change of the messages increments `Dialog.version` in the same transaction. An entry is used only when its
+    version equals the one in the database, so changes made by other workers are never missed. Messages created by
+    this worker are appended to the entry (write-through) when it was current right before the change.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[int, CachedHistory] = OrderedDict()
+        self._memory = 0
+        self._stats = HistoryCacheStats(maxsize=maxsize)
+
+    def __contains__(self, dialog_id: int) -> bool:
+        return dialog_id in self._data
+
+    def get(self, dialog_id: int) -> CachedHistory | None:
+        """
+        Cached entry, it must be checked with `validate` before use.
+        """
+        entry = self._data.get(dialog_id)
+        if entry is None:
+            self._stats.misses += 1
+        return entry
+
+    def validate(self, dialog_id: int, entry: CachedHistory, version: int | None) -> bool:
+        """
+        Whether the entry is current for the `version` read from the database (None if the dialog is deleted).
+        Outdated entries are dropped.
+        """
+        if entry.version == version:
+            self._stats.hits += 1
+            self._data.move_to_end(dialog_id)
+            return True
+        self._stats.stale += 1
+        self.invalidate(dialog_id)
+        return False
+
+    def set(self, dialog_id: int, version: int, messages: list[ViewMessage]) -> None:
+        if self.maxsize <= 0:
+            return
+        self._pop(dialog_id)
+        entry = CachedHistory(version, tuple(messages), sum(map(_message_size, messages)))
+        self._data[dialog_id] = entry
+        self._memory += entry.size
+        while len(self._data) > self.maxsize:
+            _, evicted = self._data.popitem(last=False)
+            self._memory -= evicted.size
+            self._stats.evictions += 1
+
+    def append(self, message: ViewMessage, version: int) -> None:
+        """
+        Write-through of a created message, `version` is the version of the dialog after the message was created.
+        """
+        entry = self._data.get(message.dialog_id)
+        if entry is None:
+            return
+        if entry.version != version - 1:
+            # the dialog was changed by another worker meanwhile, the entry cannot be patched
+            self.invalidate(message.dialog_id)
+            return
+        self._memory -= entry.size
+        entry = CachedHistory(version, (*entry.messages, message), entry.size + _message_size(message))
+        self._data[message.dialog_id] = entry
+        self._memory += entry.size
+        self._data.move_to_end(message.dialog_id)
+
+    def invalidate(self, dialog_id: int) -> None:
+        if self._pop(dialog_id) is not None:
+            self._stats.invalidations += 1
+
+    def _pop(self, dialog_id: int) -> CachedHistory | None:
+        entry = self._data.pop(dialog_id, None)
+        if entry is not None:
+            self._memory -= entry.size
+        return entry
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._memory = 0
+
+    def stats(self) -> HistoryCacheStats:
+        snapshot = self._stats.model_copy()
+        snapshot.size = len(self._data)
+        snapshot.messages = sum(len(entry.messages) for entry in self._data.values())
+        snapshot.memory_bytes = self._memory
+        lookups = snapshot.hits + snapshot.misses + snapshot.stale
+        snapshot.hit_ratio = snapshot.hits / lookups if lookups else 0.0
+        return snapshot
+
+
+history_cache: DialogHistoryCache = DialogHistoryCache(maxsize=api_settings.dialog_history_cache_size)
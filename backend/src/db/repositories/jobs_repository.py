@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+from typing import Any, Self
+
+from sqlalchemy import ColumnElement, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import api_settings
+from src.db import AbstractSQLAlchemyStorage
+from src.db.models import CompletionJob, Dialog, Message
+from src.schemas import JobError, JobKind, JobStatus, ViewJob, ViewMessage
+from src.schemas.chat import Models
+
+UNFINISHED = (JobStatus.QUEUED, JobStatus.RUNNING)
+CREATE_ATTEMPTS = 3
+LOST_JOB_ERROR = JobError(status_code=504, detail="The job was lost, its worker process has stopped")
+
+
+def _ago(seconds: float) -> ColumnElement[datetime]:
+    # computed by the database, so it is compared with `created_at` in the same time zone
+    return func.now() - timedelta(seconds=seconds)
+
+
+class JobRepository:
+    storage: AbstractSQLAlchemyStorage
+
+    def update_storage(self, storage: AbstractSQLAlchemyStorage) -> Self:
+        self.storage = storage
+        return self
+
+    def _create_session(self) -> AsyncSession:
+        return self.storage.create_session()
+
+    @staticmethod
+    async def _fail_lost(session: AsyncSession, *where: ColumnElement[bool]) -> None:
+        """
+        Fail unfinished jobs created more than `job_timeout` ago. Jobs are run by the worker process that accepted
+        them, such a job is left by a process that was killed before it could finish or fail it.
+        """
+        await session.execute(
+            update(CompletionJob)
+            .where(
+                CompletionJob.status.in_(UNFINISHED),
+                CompletionJob.created_at < _ago(api_settings.job_timeout),
+                *where,
+            )
+            .values(status=JobStatus.FAILED, error=LOST_JOB_ERROR.model_dump(mode="json"), finished_at=func.now())
+        )
+
+    async def create_job(
+        self, dialog_id: int, kind: JobKind, model: Models | None, message_id: int | None, priority: int
+    ) -> tuple[ViewJob, bool] | None:
+        """
+        Create a queued job unless the dialog already has an unfinished one.
+        Return the job and whether it is new, None if there is no dialog. A dialog has at most one unfinished job,
+        the unique index makes concurrent requests to the same dialog end up with the same job.
+        """
+        for attempt in range(CREATE_ATTEMPTS):
+            async with self._create_session() as session:
+                await self._fail_lost(session, CompletionJob.dialog_id == dialog_id)
+                await session.commit()
+                if await session.scalar(select(Dialog.id).where(Dialog.id == dialog_id)) is None:
+                    return None
+                query = select(CompletionJob).where(
+                    CompletionJob.dialog_id == dialog_id, CompletionJob.status.in_(UNFINISHED)
+                )
+                obj = await session.scalar(query)
+                if obj is not None:
+                    return ViewJob.model_validate(obj), False
+
+                query = (
+                    insert(CompletionJob)
+                    .values(
+                        dialog_id=dialog_id,
+                        kind=kind,
+                        model=model,
+                        message_id=message_id,
+                        priority=priority,
+                        status=JobStatus.QUEUED,
+                    )
+                    .returning(CompletionJob)
+                )
+                try:
+                    job = ViewJob.model_validate(await session.scalar(query))
+                    await session.commit()
+                    return job, True
+                except IntegrityError:
+                    # a concurrent request has created a job or deleted the dialog, the next attempt finds out which
+                    await session.rollback()
+                    if attempt == CREATE_ATTEMPTS - 1:
+                        raise
+
+    async def get_job(self, job_id: int) -> ViewJob | None:
+        """
+        The job with its answer, if it has one.
+        """
+        async with self._create_session() as session:
+            await self._fail_lost(session, CompletionJob.id == job_id)
+            await session.commit()
+            query = (
+                select(CompletionJob, Message)
+                .outerjoin(Message, Message.id == CompletionJob.result_message_id)
+                .where(CompletionJob.id == job_id)
+            )
+            row = (await session.execute(query)).one_or_none()
+            if row is None:
+                return None
+            job = ViewJob.model_validate(row[0])
+            job.result = ViewMessage.model_validate(row[1]) if row[1] is not None else None
+            return job
+
+    async def _update(self, job_id: int, from_status: JobStatus, **values: Any) -> bool:
+        """
+        Update the job if it is in `from_status`, return False if it is not in that status anymore.
+        """
+        async with self._create_session() as session:
+            result = await session.execute(
+                update(CompletionJob)
+                .where(CompletionJob.id == job_id, CompletionJob.status == from_status)
+                .values(**values)
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+    async def set_running(self, job_id: int) -> bool:
+        """
+        Start the queued job, return False if it is not queued anymore (failed as lost).
+        """
+        return await self._update(job_id, JobStatus.QUEUED, status=JobStatus.RUNNING, started_at=func.now())
+
+    async def set_succeeded(self, job_id: int, message_id: int) -> None:
+        await self._update(
+            job_id,
+            JobStatus.RUNNING,
+            status=JobStatus.SUCCEEDED,
+            result_message_id=message_id,
+            finished_at=func.now(),
+        )
+
+    async def set_failed(self, job_id: int, error: JobError) -> None:
+        await self.fail_unfinished([job_id], error)
+
+    async def fail_unfinished(self, job_ids: list[int], error: JobError) -> None:
+        """
+        Fail the jobs that are not finished yet, e.g. the jobs of a worker that shuts down.
+        """
+        if not job_ids:
+            return
+        async with self._create_session() as session:
+            await session.execute(
+                update(CompletionJob)
+                .where(CompletionJob.id.in_(job_ids), CompletionJob.status.in_(UNFINISHED))
+                .values(status=JobStatus.FAILED, error=error.model_dump(mode="json"), finished_at=func.now())
+            )
+            await session.commit()
+
+    async def delete_finished(self, older_than: float) -> int:
+        """
+        Delete finished jobs created more than `older_than` seconds ago, return the number of deleted jobs.
+        """
+        async with self._create_session() as session:
+            result = await session.execute(
+                delete(CompletionJob).where(
+                    CompletionJob.created_at < _ago(older_than), CompletionJob.status.not_in(UNFINISHED)
+                )
+            )
+            await session.commit()
+            return result.rowcount
+
+
+jobs_repository: JobRepository = JobRepository()
@@ -1,12 +1,15 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Self
 
-from sqlalchemy import insert, select
+from sqlalchemy import case, func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
 from src.db import AbstractSQLAlchemyStorage
-from src.db.models import Message
-from src.schemas import CreateMessage, ViewMessage
+from src.db.models import Dialog, Message
+from src.db.repositories.history_cache import history_cache
+from src.schemas import CreateMessage, MessagesPage, ViewMessage
+from src.schemas.chat import Roles
 
 
 class MessageRepository:
@@ -19,22 +22,74 @@ class MessageRepository:
     def _create_session(self) -> AsyncSession:
         return self.storage.create_session()
 
-    async def create_message(self, message: CreateMessage) -> ViewMessage:
+    @asynccontextmanager
+    async def _use_session(self, session: AsyncSession | None) -> AsyncIterator[AsyncSession]:
+        """
+        Use the session of the request if it is given, otherwise a new one.
+        """
+        if session is not None:
+            yield session
+            return
         async with self._create_session() as session:
+            yield session
+
+    async def create_message(self, message: CreateMessage, session: AsyncSession | None = None) -> ViewMessage:
+        async with self._use_session(session) as session:
             query = insert(Message).values(**message.model_dump()).returning(Message)
             obj = await session.scalar(query)
             message = ViewMessage.model_validate(obj)
+            # the dialog row is locked by the update until commit, so concurrent messages are counted correctly
+            version = await session.scalar(
+                update(Dialog)
+                .where(Dialog.id == message.dialog_id)
+                .values(
+                    last_message_id=message.id,
+                    last_role=message.role,
+                    message_count=Dialog.message_count + 1,
+                    updated_at=func.now(),
+                    version=Dialog.version + 1,
+                )
+                .returning(Dialog.version)
+            )
             await session.commit()
+            history_cache.append(message, version)
             return message
 
     async def get_dialog_messages(self, dialog_id: int, amount: int) -> list[ViewMessage]:
+        """
+        Last `amount` messages of the dialog, oldest first.
+        """
         async with self._create_session() as session:
-            query = select(Message).where(Message.dialog_id == dialog_id).order_by(Message.id).limit(amount)
+            query = select(Message).where(Message.dialog_id == dialog_id).order_by(Message.id.desc()).limit(amount)
             objs = await session.scalars(query)
-            return [ViewMessage.model_validate(obj) for obj in objs]
-
-    async def get_message_by_id(self, message_id: int) -> ViewMessage | None:
+            return [ViewMessage.model_validate(obj) for obj in reversed(objs.all())]
+
+    async def get_messages_page(
+        self, dialog_id: int, limit: int, before_id: int | None = None, after_id: int | None = None
+    ) -> MessagesPage:
+        """
+        Page of the dialog history by keyset: up to `limit` messages right after `after_id` if it is set,
+        otherwise right before `before_id` (the latest messages if it is not set either).
+        Only the requested page is read, using the (dialog_id, id) index.
+        """
         async with self._create_session() as session:
+            query = select(Message).where(Message.dialog_id == dialog_id)
+            if before_id is not None:
+                query = query.where(Message.id < before_id)
+            if after_id is not None:
+                query = query.where(Message.id > after_id).order_by(Message.id)
+            else:
+                query = query.order_by(Message.id.desc())
+            # one extra row tells whether there is a next page
+            objs = (await session.scalars(query.limit(limit + 1))).all()
+            has_more = len(objs) > limit
+            objs = objs[:limit]
+            if after_id is None:
+                objs.reverse()
+            return MessagesPage(messages=[ViewMessage.model_validate(obj) for obj in objs], has_more=has_more)
+
+    async def get_message_by_id(self, message_id: int, session: AsyncSession | None = None) -> ViewMessage | None:
+        async with self._use_session(session) as session:
             query = select(Message).where(Message.id == message_id)
             obj = await session.scalar(query)
             if obj is not None:
@@ -43,49 +98,74 @@ class MessageRepository:
 
     async def get_response(self, message_id: int) -> ViewMessage | None:
         async with self._create_session() as session:
-            query = select(Message).where(Message.id == message_id)
-            message: Message = await session.scalar(query)
-            if message.reply is not None:
-                return ViewMessage.model_validate(message.reply)
+            query = select(Message).where(Message.reply_to == message_id)
+            obj = await session.scalar(query)
+            if obj is not None:
+                return ViewMessage.model_validate(obj)
             return None
 
-    async def get_request(self, message_id: int) -> ViewMessage | None:
-        async with self._create_session() as session:
-            result = await session.execute(
-                select(Message).options(joinedload(Message.parent)).where(Message.id == message_id)
-            )
-            message: Message = result.unique().scalar_one_or_none()
-            if not message or not message.parent:
-                return None
-
-            return ViewMessage.model_validate(message.parent)
+    async def get_request(self, message_id: int, session: AsyncSession | None = None) -> ViewMessage | None:
+        async with self._use_session(session) as session:
+            reply_to = select(Message.reply_to).where(Message.id == message_id).scalar_subquery()
+            obj = await session.scalar(select(Message).where(Message.id == reply_to))
+            if obj is not None:
+                return ViewMessage.model_validate(obj)
+            return None
 
     async def get_reply(self, message_id: int) -> ViewMessage | None:
-        async with self._create_session() as session:
-            result = await session.execute(
-                select(Message).options(joinedload(Message.reply)).where(Message.id == message_id)
-            )
-            message: Message = result.scalar_one_or_none()
-            if not message or not message.reply:
-                return None
-
-            return ViewMessage.model_validate(message.parent)
+        return await self.get_response(message_id)
 
-    async def get_all_dialog_messages(self, dialog_id: int) -> list[ViewMessage]:
+    async def get_last_role(self, dialog_id: int) -> Roles | None:
+        """
+        Role of the last message in the dialog, None if the dialog is empty.
+        """
         async with self._create_session() as session:
+            role = await session.scalar(select(Dialog.last_role).where(Dialog.id == dialog_id))
+            return Roles(role) if role is not None else None
+
+    async def get_all_dialog_messages(self, dialog_id: int, session: AsyncSession | None = None) -> list[ViewMessage]:
+        async with self._use_session(session) as session:
             query = select(Message).where(Message.dialog_id == dialog_id).order_by(Message.id)
-            result = await session.execute(query)
-            objs = result.unique().scalars().all()
-        return [ViewMessage.model_validate(obj) for obj in objs]
+            objs = await session.scalars(query)
+            return [ViewMessage.model_validate(obj) for obj in objs]
 
-    async def delete_message(self, message_id: int) -> ViewMessage | None:
-        async with self._create_session() as session:
+    async def delete_message(self, message_id: int, session: AsyncSession | None = None) -> ViewMessage | None:
+        async with self._use_session(session) as session:
             obj = await session.get(Message, message_id)
             if obj is None:
                 return None
             await session.delete(obj)
+            await session.flush()
+            # the reply to the message is deleted by cascade too, so the state is recomputed from what is left
+            await self._refresh_dialog_state(obj.dialog_id, session, deleted_id=obj.id)
             await session.commit()
+            history_cache.invalidate(obj.dialog_id)
             return ViewMessage.model_validate(obj)
 
+    async def _refresh_dialog_state(self, dialog_id: int, session: AsyncSession, deleted_id: int) -> None:
+        """
+        Recompute the last message and the message count of the dialog, by the (dialog_id, id) index.
+        The history summary is dropped if it covers the deleted message.
+        """
+        summary_outdated = Dialog.summary_until_id >= deleted_id
+        last_message_id = (
+            select(Message.id).where(Message.dialog_id == dialog_id).order_by(Message.id.desc()).limit(1)
+        ).scalar_subquery()
+        last_role = select(Message.role).where(Message.id == last_message_id).scalar_subquery()
+        message_count = select(func.count()).where(Message.dialog_id == dialog_id).scalar_subquery()
+        await session.execute(
+            update(Dialog)
+            .where(Dialog.id == dialog_id)
+            .values(
+                last_message_id=last_message_id,
+                last_role=last_role,
+                message_count=message_count,
+                updated_at=func.now(),
+                version=Dialog.version + 1,
+                summary=case((summary_outdated, None), else_=Dialog.summary),
+                summary_until_id=case((summary_outdated, None), else_=Dialog.summary_until_id),
+            )
+        )
+
 
 messages_repository: MessageRepository = MessageRepository()
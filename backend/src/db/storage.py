@@ -25,10 +25,10 @@ class SQLAlchemyStorage(AbstractSQLAlchemyStorage):
         self.sessionmaker = async_sessionmaker(expire_on_commit=False, bind=self.engine)
 
     @classmethod
-    def from_url(cls, url: str) -> "SQLAlchemyStorage":
+    def from_url(cls, url: str, pool_size: int = 5, max_overflow: int = 10) -> "SQLAlchemyStorage":
         from sqlalchemy.ext.asyncio import create_async_engine
 
-        engine = create_async_engine(url)
+        engine = create_async_engine(url, pool_size=pool_size, max_overflow=max_overflow)
         return cls(engine)
 
     def create_session(self) -> AsyncSession:
@@ -174,19 +174,28 @@ def check_database_access():
 def initialize_vector_index() -> None:
     """
     Process documentation and build FAISS index for RAG.
+    The index is updated incrementally when the documentation changes.
     """
     from src.rag import build_faiss_index, load_and_split
+    from src.rag.indexer import convert_legacy_index, file_hash, index_exists, read_manifest
+    from src.schemas.rag import IndexSpec
 
     settings = get_settings()
     doc_path = Path(settings.get("api_settings", {}).get("def_json_documentation_path"))
     rag_index_path = Path(settings.get("api_settings", {}).get("rag_index_path"))
 
-    if rag_index_path.exists() and any(rag_index_path.iterdir()):
-        print(f"✅ RAG index already exists at: {rag_index_path}, skipping build.")
-        return
+    try:
+        if convert_legacy_index(str(rag_index_path)):
+            print(f"✅ RAG index at: {rag_index_path} converted from the pickle format to the native one.")
+    except Exception as e:
+        print(f"❌ Failed to convert RAG index at: {rag_index_path}: {e}")
+    has_index = index_exists(str(rag_index_path))
 
     if not doc_path.exists():
-        print(f"❌ Documentation pdf/docx/md not found at: {doc_path}")
+        if has_index:
+            print(f"⚠️ Documentation not found at: {doc_path}, using existing RAG index at: {rag_index_path}")
+        else:
+            print(f"❌ Documentation pdf/docx/md not found at: {doc_path}")
         return
     if doc_path.suffix not in {".pdf", ".md", ".doc", ".docx"}:
         print(f"❌ {doc_path} has unsupported extension: {doc_path.suffix}")
@@ -194,11 +203,27 @@ def initialize_vector_index() -> None:
 
     print(f"✅ Documentation pdf/docx/md found at: {doc_path}")
 
+    source_hash = file_hash(str(doc_path))
+    index_spec = IndexSpec.model_validate(settings.get("api_settings", {}).get("rag_index") or {})
+    manifest = read_manifest(str(rag_index_path)) if has_index else None
+    if (
+        manifest is not None
+        and manifest.source_hash == source_hash
+        and manifest.index_spec == index_spec
+        and manifest.lexical_index
+    ):
+        print(f"✅ RAG index at: {rag_index_path} is up to date, skipping build.")
+        return
+
     try:
         print("⚙️ Building vector index from documentation...")
         chunks = load_and_split(str(doc_path))
-        build_faiss_index(chunks, str(rag_index_path))
-        print(f"✅ Vector index created at `{rag_index_path}` with {len(chunks)} chunks.")
+        update = build_faiss_index(chunks, str(rag_index_path), source_hash=source_hash, spec=index_spec)
+        print(
+            f"✅ Vector index updated at `{rag_index_path}`: {len(chunks)} chunks, "
+            f"{update.added} embedded, {update.kept} reused, {update.removed} removed, "
+            f"`{read_manifest(str(rag_index_path)).index_factory}` index."
+        )
     except Exception as e:
         print(f"❌ Failed to build vector index: {e}")
 
@@ -1,8 +1,11 @@
+from src.rag.context import build_context, estimate_tokens
 from src.rag.indexer import build_faiss_index, load_faiss_index
 from src.rag.loader import load_and_split
 from src.rag.retriever import VectorRetriever
 
 __all__ = [
+    "build_context",
+    "estimate_tokens",
     "build_faiss_index",
     "load_faiss_index",
     "load_and_split",
@@ -0,0 +1,114 @@
+__all__ = ["build_context", "estimate_tokens"]
+
+import math
+
+from langchain.schema import Document
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+MIN_OVERLAP = 32
+"Minimal number of characters two chunks must share to be merged"
+MAX_ADJACENT_GAP = 2
+"Maximal number of characters (stripped whitespace) between adjacent chunks to be merged"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of the text (~4 characters per token), good enough to keep prompts in a budget.
+    """
+    return math.ceil(len(text) / 4)
+
+
+def _overlap(left: str, right: str) -> int:
+    """
+    Length of the longest suffix of `left` that is a prefix of `right`.
+    """
+    probe = right[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    pos = left.find(probe)
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.find(probe, pos + 1)
+    return 0
+
+
+class _Span:
+    """
+    Continuous piece of a source document assembled from one or more chunks.
+    """
+
+    def __init__(self, text: str, source: str | None, start: int | None) -> None:
+        self.text = text
+        self.source = source
+        self.start = start
+
+    @classmethod
+    def from_document(cls, doc: Document) -> "_Span":
+        return cls(doc.page_content, doc.metadata.get("source"), doc.metadata.get("start_index"))
+
+    def merged(self, other: "_Span") -> "_Span | None":
+        """
+        Span covering both spans, or None if they are not overlapping or adjacent.
+        """
+        if other.source != self.source:
+            return None
+        if other.text in self.text:
+            return self
+        if self.text in other.text:
+            return other
+
+        if self.start is not None and other.start is not None:
+            if 0 <= other.start - (self.start + len(self.text)) <= MAX_ADJACENT_GAP:
+                return _Span(self.text + "\n" + other.text, self.source, self.start)
+            if 0 <= self.start - (other.start + len(other.text)) <= MAX_ADJACENT_GAP:
+                return _Span(other.text + "\n" + self.text, self.source, other.start)
+
+        if overlap := _overlap(self.text, other.text):
+            return _Span(self.text + other.text[overlap:], self.source, self.start)
+        if overlap := _overlap(other.text, self.text):
+            return _Span(other.text + self.text[overlap:], self.source, other.start)
+        return None
+
+
+def build_context(docs: list[Document], token_budget: int | None = None) -> str:
+    """
+    Join retrieved chunks (most relevant first) into a documentation context for the prompt.
+
+    Overlapping and adjacent chunks of the same source are merged, so the shared text is included once.
+    Chunks are taken by relevance while the estimated size of the context fits into `token_budget`.
+    """
+    spans: list[_Span] = []
+    used = 0
+    for doc in docs:
+        chunk = _Span.from_document(doc)
+        for i, span in enumerate(spans):
+            merged = span.merged(chunk)
+            if merged is None:
+                continue
+            cost = estimate_tokens(merged.text) - estimate_tokens(span.text)
+            if token_budget is None or used + cost <= token_budget:
+                spans[i] = merged
+                used += cost
+            break
+        else:
+            cost = estimate_tokens(chunk.text)
+            if token_budget is None or used + cost <= token_budget:
+                spans.append(chunk)
+                used += cost
+
+    # a grown span may now overlap another one, merging them only makes the context smaller
+    merged_any = True
+    while merged_any:
+        merged_any = False
+        for i in range(len(spans)):
+            for j in range(i + 1, len(spans)):
+                merged = spans[i].merged(spans[j])
+                if merged is not None:
+                    spans[i] = merged
+                    del spans[j]
+                    merged_any = True
+                    break
+            if merged_any:
+                break
+    return CONTEXT_SEPARATOR.join(span.text for span in spans)
@@ -1,15 +1,30 @@
-import os
+import asyncio
+import hashlib
+from pathlib import Path
 
 import httpx
+import numpy as np
 from langchain.embeddings.base import Embeddings
 from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
+from pydantic import BaseModel
 
 from src.config import api_settings
+from src.rag.ingest import CHECKPOINT_FILENAME, EmbeddingCheckpoint, embed_chunks
+from src.rag.store import (
+    CHUNKS_FILENAME,
+    VECTORS_FILENAME,
+    ChunkIndex,
+    write_chunk_index,
+)
 from src.schemas.chat import Models
+from src.schemas.rag import IndexSpec
+from src.upstream import MwsClient, resilient_request, upstream_timeout
 
 EMBEDDING_MODEL = Models.BGE_M3.value
 MWS_GPT_API_EMBEDDING_ENDPOINT = api_settings.mws_gpt_api_url + "/v1/embeddings"
+EMBEDDINGS = "embeddings"
+"Name of the endpoint for the upstream limiter"
 
 
 class MwsEmbeddings(Embeddings):
@@ -23,22 +38,47 @@ class MwsEmbeddings(Embeddings):
         endpoint: str = MWS_GPT_API_EMBEDDING_ENDPOINT,
         model: Models = Models.BGE_M3,
         max_batch_size: int = 100,
+        async_client: httpx.AsyncClient | None = None,
     ) -> None:
         self.api_key = api_key
         self.endpoint = endpoint
         self.model = model
         self.max_batch_size = max_batch_size
+        self.async_client = async_client
 
-    def _post(self, inputs):
-        payload = {"model": self.model.value, "input": inputs}
-        headers = {
+    def _headers(self) -> dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
-        resp = httpx.post(self.endpoint, json=payload, headers=headers, timeout=60)
+
+    def _post(self, inputs):
+        payload = {"model": self.model.value, "input": inputs}
+        resp = httpx.post(self.endpoint, json=payload, headers=self._headers(), timeout=60)
         resp.raise_for_status()
         return resp.json()["data"]
 
+    async def _apost(self, inputs):
+        """
+        Same as `_post`, but uses the shared pooled async client (or `async_client` if set)
+        and does not block the event loop. Requests through the shared client are retried and wait for their turn
+        in the upstream limiter, the index build paces and retries its own batches.
+        """
+        payload = {"model": self.model.value, "input": inputs}
+        if self.async_client is not None:
+            resp = await self.async_client.post(self.endpoint, json=payload, headers=self._headers(), timeout=60)
+            resp.raise_for_status()
+            return resp.json()["data"]
+
+        client = MwsClient.get()
+        async with resilient_request(
+            EMBEDDINGS,
+            self.model,
+            lambda: client.post(self.endpoint, json=payload, headers=self._headers(), timeout=upstream_timeout()),
+        ) as resp:
+            resp.raise_for_status()
+            return resp.json()["data"]
+
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
         """
         texts: a list of document‑chunks
@@ -60,25 +100,206 @@ class MwsEmbeddings(Embeddings):
         data = self._post([text])
         return data[0]["embedding"]
 
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Async version of `embed_documents`
+        """
+        all_embeddings: list[list[float]] = []
+        for i in range(0, len(texts), self.max_batch_size):
+            batch = texts[i : i + self.max_batch_size]
+            data = await self._apost(batch)
+            all_embeddings.extend(item["embedding"] for item in data)
+        return all_embeddings
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """
+        Async version of `embed_query`
+        """
+        data = await self._apost([text])
+        return data[0]["embedding"]
+
+
+MANIFEST_FILENAME = "manifest.json"
+LEGACY_FILENAMES = ("index.faiss", "index.pkl")
+"Files written by LangChain `FAISS.save_local`"
 
-def build_faiss_index(chunks: list[Document], index_path: str) -> None:
+
+class IndexManifest(BaseModel):
     """
-    Build & persist a FAISS index using MWS embeddings API.
+    Description of the persisted index, stored next to it.
     """
+
+    embedding_model: str
+    "Model used to embed the chunks, the index is rebuilt from scratch if it changes"
+    source_hash: str | None = None
+    "SHA-256 of the documentation file the index was built from"
+    chunk_count: int = 0
+    "Number of chunks in the index"
+    dimension: int | None = None
+    "Dimension of the chunk vectors"
+    index_spec: IndexSpec = IndexSpec()
+    "Requested type and parameters of the vector index"
+    index_factory: str = "Flat"
+    "FAISS description of the vector index actually built"
+    lexical_index: bool = False
+    "Whether the chunk store has the BM25 index, indexes built before it was introduced are rebuilt without embedding"
+
+
+class IndexUpdate(BaseModel):
+    added: int = 0
+    "Chunks embedded and added to the index"
+    removed: int = 0
+    "Chunks deleted from the index"
+    kept: int = 0
+    "Chunks reused without embedding"
+
+
+def chunk_hash(chunk: Document) -> str:
+    """
+    Content hash of a chunk. Chunks with the same text share the embedding.
+    """
+    return hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(index_path: str) -> IndexManifest | None:
+    path = Path(index_path) / MANIFEST_FILENAME
+    if not path.exists():
+        return None
+    return IndexManifest.model_validate_json(path.read_text(encoding="utf-8"))
+
+
+def write_manifest(index_path: str, manifest: IndexManifest) -> None:
+    path = Path(index_path) / MANIFEST_FILENAME
+    path.write_text(manifest.model_dump_json(indent=2), encoding="utf-8")
+
+
+def index_exists(index_path: str) -> bool:
+    path = Path(index_path)
+    return (path / VECTORS_FILENAME).exists() and (path / CHUNKS_FILENAME).exists()
+
+
+def convert_legacy_index(index_path: str) -> bool:
+    """
+    Convert an index saved by LangChain `FAISS.save_local` (pickled docstore) to the native layout.
+    Vectors are copied as they are, nothing is embedded again. Returns True if the index was converted.
+    The legacy files are left in place, they are ignored once the native index exists and may be deleted.
+    """
+    path = Path(index_path)
+    if index_exists(index_path) or not all((path / name).exists() for name in LEGACY_FILENAMES):
+        return False
+
     api_key = api_settings.mws_gpt_api_key.get_secret_value()
-    embedder = MwsEmbeddings(api_key=api_key)
+    # the last time the pickle is loaded, the native index is used from now on
+    legacy = FAISS.load_local(index_path, MwsEmbeddings(api_key=api_key), allow_dangerous_deserialization=True)
+    all_vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+    chunks: dict[str, Document] = {}
+    rows: list[int] = []
+    for position, doc_id in sorted(legacy.index_to_docstore_id.items()):
+        doc = legacy.docstore.search(doc_id)
+        if not isinstance(doc, Document) or chunk_hash(doc) in chunks:
+            continue
+        chunks[chunk_hash(doc)] = doc
+        rows.append(position)
+
+    write_chunk_index(index_path, list(chunks.items()), all_vectors[rows])
+    manifest = read_manifest(index_path) or IndexManifest(embedding_model=EMBEDDING_MODEL)
+    manifest.chunk_count = len(chunks)
+    manifest.dimension = legacy.index.d
+    manifest.lexical_index = True
+    write_manifest(index_path, manifest)
+    return True
+
+
+def build_faiss_index(
+    chunks: list[Document], index_path: str, source_hash: str | None = None, spec: IndexSpec | None = None
+) -> IndexUpdate:
+    """
+    Build & persist the chunk index using MWS embeddings API.
+    The vector index is built by `spec` (`rag_index` setting by default), approximate ones are trained on all vectors.
+
+    If an index built with the same embedding model already exists at `index_path`, it is updated incrementally:
+    only new or changed chunks are embedded, vectors of unchanged chunks are reused.
+    Chunks are embedded by concurrent batches, an interrupted build resumes from the checkpoint in `index_path`.
+    """
+    api_key = api_settings.mws_gpt_api_key.get_secret_value()
+    embedder = MwsEmbeddings(api_key=api_key, max_batch_size=api_settings.rag_embedding_batch_size)
+    spec = spec or api_settings.rag_index
+
+    new_chunks: dict[str, Document] = {}
+    for chunk in chunks:
+        new_chunks.setdefault(chunk_hash(chunk), chunk)
+    if not new_chunks:
+        raise ValueError("Cannot build an index without chunks")
+
+    convert_legacy_index(index_path)
+    existing: ChunkIndex | None = None
+    existing_ids: dict[str, int] = {}
+    manifest = read_manifest(index_path) if index_exists(index_path) else None
+    if manifest is not None and manifest.embedding_model == embedder.model.value:
+        existing = ChunkIndex(index_path, embedder)
+        existing_ids = existing.store.hashes()
+
+    update = IndexUpdate()
+    update.removed = sum(1 for h in existing_ids if h not in new_chunks)
+    kept = {h: chunk_id for h, chunk_id in existing_ids.items() if h in new_chunks}
+    update.kept = len(kept)
 
-    index = FAISS.from_documents(chunks, embedder)
+    checkpoint = EmbeddingCheckpoint(Path(index_path) / CHECKPOINT_FILENAME, embedder.model.value)
+    to_add = {h: chunk.page_content for h, chunk in new_chunks.items() if h not in kept}
+    vectors_by_hash: dict[str, list[float]] = {}
+    if to_add:
+        vectors_by_hash = asyncio.run(
+            embed_chunks(
+                to_add,
+                embedder,
+                checkpoint,
+                concurrency=api_settings.rag_embedding_concurrency,
+                max_retries=api_settings.rag_embedding_max_retries,
+            )
+        )
+        update.added = len(to_add)
 
-    os.makedirs(os.path.dirname(index_path), exist_ok=True)
-    index.save_local(index_path)
+    # chunks keep the document order, metadata of unchanged chunks is refreshed as their positions may shift
+    vectors = np.stack(
+        [
+            existing.vectors[kept[h]] if h in kept else np.asarray(vectors_by_hash[h], dtype=np.float32)
+            for h in new_chunks
+        ]
+    )
+    if existing is not None:
+        existing.close()
+    index_factory = write_chunk_index(index_path, list(new_chunks.items()), vectors, spec)
+    write_manifest(
+        index_path,
+        IndexManifest(
+            embedding_model=embedder.model.value,
+            source_hash=source_hash,
+            chunk_count=len(new_chunks),
+            dimension=vectors.shape[1],
+            index_spec=spec,
+            index_factory=index_factory,
+            lexical_index=True,
+        ),
+    )
+    checkpoint.remove()
+    return update
 
 
-def load_faiss_index(index_path: str) -> FAISS:
+def load_faiss_index(index_path: str) -> ChunkIndex:
     """
-    Load a FAISS index (for retrieval) with the same MWS embedder.
+    Open the chunk index (for retrieval) with the same MWS embedder. Vectors are memory-mapped, not read.
     """
+    if not index_exists(index_path):
+        raise FileNotFoundError(f"No index at `{index_path}`, run the prepare script to build or convert it")
     api_key = api_settings.mws_gpt_api_key.get_secret_value()
     embedder = MwsEmbeddings(api_key=api_key)
 
-    return FAISS.load_local(index_path, embedder, allow_dangerous_deserialization=True)
+    return ChunkIndex(index_path, embedder)
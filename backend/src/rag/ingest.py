@@ -0,0 +1,166 @@
+__all__ = ["CHECKPOINT_FILENAME", "EmbeddingCheckpoint", "embed_chunks"]
+
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import httpx
+
+if TYPE_CHECKING:
+    from src.rag.indexer import MwsEmbeddings
+
+CHECKPOINT_FILENAME = "embeddings.checkpoint.jsonl"
+MAX_BACKOFF = 30.0
+"Maximum delay in seconds between retries of one batch"
+
+
+class EmbeddingCheckpoint:
+    """
+    Append-only file with vectors of already embedded chunks, so an interrupted index build resumes where it stopped.
+    """
+
+    def __init__(self, path: Path, model: str) -> None:
+        self.path = path
+        self.model = model
+
+    def load(self) -> dict[str, list[float]]:
+        if not self.path.exists():
+            return {}
+        vectors: dict[str, list[float]] = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be cut if the build was killed while writing
+                    continue
+                if record.get("model") == self.model:
+                    vectors[record["hash"]] = record["embedding"]
+        return vectors
+
+    def append(self, vectors: dict[str, list[float]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        cut_line = False
+        if self.path.exists() and self.path.stat().st_size > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                cut_line = f.read(1) != b"\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            if cut_line:
+                f.write("\n")
+            for chunk_hash, embedding in vectors.items():
+                f.write(json.dumps({"model": self.model, "hash": chunk_hash, "embedding": embedding}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+def _is_too_large(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 413
+    return isinstance(e, httpx.TimeoutException)
+
+
+def _retry_after(e: Exception) -> float | None:
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            return float(e.response.headers.get("Retry-After", ""))
+        except ValueError:
+            return None
+    return None
+
+
+async def _post_with_retry(
+    embedder: "MwsEmbeddings", inputs: list[str], max_retries: int, retry_timeouts: bool
+) -> list[dict]:
+    """
+    Embed one batch, retrying transient errors with jittered exponential backoff.
+    Timeouts are not retried unless `retry_timeouts` is set, the caller splits the batch instead.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            data = await embedder._apost(inputs)
+            return sorted(data, key=lambda item: item.get("index", 0))
+        except Exception as e:
+            if not _is_retryable(e) or attempt == max_retries:
+                raise
+            if isinstance(e, httpx.TimeoutException) and not retry_timeouts:
+                raise
+            delay = _retry_after(e) or min(MAX_BACKOFF, 2**attempt) * random.uniform(0.5, 1.5)
+            print(f"  ⚠️ Embedding batch of {len(inputs)} failed ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+async def embed_chunks(
+    texts: dict[str, str],
+    embedder: "MwsEmbeddings",
+    checkpoint: EmbeddingCheckpoint,
+    concurrency: int = 4,
+    max_retries: int = 5,
+) -> dict[str, list[float]]:
+    """
+    Embed texts (chunk hash -> text) by batches sent concurrently.
+
+    Every completed batch is written to the checkpoint, texts found in the checkpoint are not embedded again.
+    The batch size is halved when the API rejects a batch as too large or times out,
+    and grows back to `embedder.max_batch_size` after successful batches.
+    """
+    vectors = {h: v for h, v in checkpoint.load().items() if h in texts}
+    if vectors:
+        print(f"  ♻️ Resuming: {len(vectors)}/{len(texts)} chunks found in checkpoint `{checkpoint.path}`")
+    pending = deque(h for h in texts if h not in vectors)
+    resumed = len(vectors)
+    batch_size = embedder.max_batch_size
+    start = time.monotonic()
+
+    async def worker() -> None:
+        nonlocal batch_size
+        while pending:
+            batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            try:
+                data = await _post_with_retry(
+                    embedder, [texts[h] for h in batch], max_retries, retry_timeouts=len(batch) == 1
+                )
+            except Exception as e:
+                if _is_too_large(e) and len(batch) > 1:
+                    batch_size = max(1, min(batch_size, len(batch) // 2))
+                    print(f"  ⚠️ Batch of {len(batch)} chunks is too large ({e!r}), reducing to {batch_size}")
+                    pending.extendleft(reversed(batch))
+                    continue
+                raise
+
+            batch_vectors = {h: item["embedding"] for h, item in zip(batch, data, strict=True)}
+            checkpoint.append(batch_vectors)
+            vectors.update(batch_vectors)
+            batch_size = min(embedder.max_batch_size, batch_size + max(1, batch_size // 4))
+
+            elapsed = time.monotonic() - start
+            rate = (len(vectors) - resumed) / elapsed if elapsed else 0.0
+            print(f"  ⏳ Embedded {len(vectors)}/{len(texts)} chunks ({rate:.1f} chunks/s)")
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        embedder.async_client = client
+        try:
+            async with asyncio.TaskGroup() as group:
+                for _ in range(min(concurrency, len(pending))):
+                    group.create_task(worker())
+        except* Exception as group_error:
+            raise group_error.exceptions[0] from None
+        finally:
+            embedder.async_client = None
+
+    return vectors
@@ -32,5 +32,6 @@ def load_and_split(doc_path: str) -> list[Document]:
         chunk_size=1000,
         chunk_overlap=500,
         length_function=lambda txt: len(txt.split()),
+        add_start_index=True,
     )
     return splitter.split_documents(docs)
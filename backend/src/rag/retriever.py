@@ -1,17 +1,113 @@
-from langchain_community.vectorstores import FAISS
+import asyncio
+import os
+import re
+import unicodedata
 
+import httpx
+import numpy as np
+from langchain.schema import Document
+
+from src.api.logging_ import logger
+from src.cache import AsyncTTLCache
+from src.config import api_settings
+from src.rag.context import build_context
 from src.rag.indexer import load_faiss_index
+from src.rag.store import ChunkIndex
+from src.schemas.status import RetrievalCacheStats
+from src.upstream import UpstreamBusyError
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize query text so that trivially different queries share cache entries.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip()
+
+
+def index_version(index_path: str) -> str:
+    """
+    Cheap fingerprint of the index files on disk, changes whenever the index is rebuilt.
+    """
+    parts = []
+    for name in sorted(os.listdir(index_path)):
+        stat = os.stat(os.path.join(index_path, name))
+        parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return ";".join(parts)
+
+
+def reciprocal_rank_fusion(rankings: list[list[tuple[Document, float]]], k: int = 60) -> list[tuple[Document, float]]:
+    """
+    Merge ranked lists of documents: a document scores 1 / (k + rank) for every list it appears in.
+    Scores of the lists themselves are not comparable and are ignored.
+    """
+    fused: dict[str, tuple[Document, float]] = {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            score = fused[key][1] if key in fused else 0.0
+            fused[key] = (doc, score + 1 / (k + rank))
+    return sorted(fused.values(), key=lambda item: item[1], reverse=True)
+
+
+def scaled_scores(docs_and_scores: list[tuple[Document, float]]) -> np.ndarray:
+    """
+    Scores of a ranking scaled to [0, 1]: the first document scores 1 and the last one 0.
+    """
+    scores = np.asarray([score for _, score in docs_and_scores], dtype=np.float32)
+    if len(scores) == 0:
+        return scores
+    spread = float(scores.max() - scores.min())
+    return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+
+def maximal_marginal_relevance(relevance: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float) -> list[int]:
+    """
+    Select k of the candidate vectors one by one, each maximizing
+    `lambda_mult * relevance - (1 - lambda_mult) * max similarity to already selected`.
+    `relevance` of the candidates is on the scale of cosine similarity, e.g. scaled to [0, 1].
+    Returns indices of the selected candidates in the order of selection.
+    """
+    if len(candidates) == 0:
+        return []
+    candidates = _unit(candidates)
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
 
 
 class VectorRetriever:
-    _index: FAISS | None = None
+    _index: ChunkIndex | None = None
+    _index_version: str = ""
+    _embeddings_cache = AsyncTTLCache(api_settings.rag_cache_size, api_settings.rag_cache_ttl)
+    _results_cache = AsyncTTLCache(api_settings.rag_cache_size, api_settings.rag_cache_ttl)
 
     @classmethod
     def init(cls, index_path: str) -> None:
         """
-        Initialize the vector index by loading it from the specified path
+        Initialize the vector index by opening it from the specified path
         """
+        if cls._index is not None:
+            cls._index.close()
         cls._index = load_faiss_index(index_path)
+        cls._index.warm_up()
+        cls._index_version = index_version(index_path)
+        cls._results_cache.clear()
+
+    @classmethod
+    def is_initialized(cls) -> bool:
+        return cls._index is not None
 
     @classmethod
     def retrieve(cls, query: str, k: int = 25) -> str:
@@ -21,5 +117,100 @@ class VectorRetriever:
         if cls._index is None:
             raise RuntimeError("Vector index not initialized. Call VectorRetriever.init() first.")
         docs_and_scores = cls._index.similarity_search_with_score(query, k=k)
-        snippets = [doc.page_content for doc, _ in docs_and_scores]
-        return "\n\n---\n\n".join(snippets)
+        if api_settings.rag_lexical_search:
+            lexical = cls._index.lexical_search_with_score(normalize_query(query), k=k)
+            docs_and_scores = reciprocal_rank_fusion([docs_and_scores, lexical], api_settings.rag_rrf_k)[:k]
+        return build_context([doc for doc, _ in docs_and_scores])
+
+    @classmethod
+    async def aretrieve(cls, query: str, k: int | None = None, token_budget: int | None = None) -> str:
+        """
+        Async version of `retrieve`. The query is embedded without blocking the event loop.
+        Embeddings and search results are cached, concurrent calls with the same query share one upstream call.
+        Overlapping snippets are merged and the context is limited to `token_budget` estimated tokens.
+        """
+        docs_and_scores = await cls.asearch(query, k or api_settings.rag_top_k)
+        return build_context([doc for doc, _ in docs_and_scores], token_budget)
+
+    @classmethod
+    async def aembed_query(cls, query: str) -> list[float]:
+        """
+        Embed the query using the cache of query embeddings.
+        """
+        if cls._index is None:
+            raise RuntimeError("Vector index not initialized. Call VectorRetriever.init() first.")
+        embeddings = cls._index.embeddings
+        normalized = normalize_query(query)
+        key = (normalized, embeddings.model.value)
+        return await cls._embeddings_cache.get_or_create(key, lambda: embeddings.aembed_query(normalized))
+
+    @classmethod
+    async def asearch(cls, query: str, k: int = 25) -> list[tuple[Document, float]]:
+        """
+        Find the k most relevant documents to the query.
+
+        Vector search results are fused with BM25 lexical search results by reciprocal rank fusion,
+        so exact identifiers from the query are not missed. If the query embedding fails or takes longer than
+        `rag_embedding_timeout`, lexical search results are used alone.
+        Unless `rag_mmr_lambda` is null, the k documents are then selected from `rag_mmr_fetch_k` candidates by
+        maximal marginal relevance, so near-duplicate chunks do not crowd out other sections. The relevance of
+        a candidate is its fused score, so lexical hits keep their rank, and stored vectors only measure redundancy.
+        """
+        if cls._index is None:
+            raise RuntimeError("Vector index not initialized. Call VectorRetriever.init() first.")
+        index = cls._index
+        mmr_lambda = api_settings.rag_mmr_lambda
+        fetch_k = k if mmr_lambda is None else max(k, api_settings.rag_mmr_fetch_k)
+
+        lexical = []
+        if api_settings.rag_lexical_search:
+            lexical = index.lexical_search_with_score(normalize_query(query), fetch_k)
+        try:
+            # the shared search task is not cancelled by the timeout and still fills the cache
+            timeout = api_settings.rag_embedding_timeout if lexical else None
+            vector = await asyncio.wait_for(cls.avector_search(query, fetch_k), timeout)
+        except (TimeoutError, httpx.HTTPError, UpstreamBusyError) as e:
+            if not lexical:
+                raise
+            logger.warning(f"Vector search failed ({e!r}), using lexical search results only")
+            vector = []
+
+        if not lexical:
+            candidates = vector
+            if mmr_lambda is None:
+                return candidates[:k]
+            vectors = index.vectors_of([doc for doc, _ in candidates])
+            # the query embedding is cached by the vector search, no upstream call here
+            query_vector = np.asarray(await cls.aembed_query(query), dtype=np.float32)
+            relevance = _unit(vectors) @ _unit(query_vector)
+        else:
+            candidates = reciprocal_rank_fusion([vector, lexical], api_settings.rag_rrf_k)
+            if mmr_lambda is None:
+                return candidates[:k]
+            vectors = index.vectors_of([doc for doc, _ in candidates])
+            relevance = scaled_scores(candidates)
+        selected = maximal_marginal_relevance(relevance, vectors, k, mmr_lambda)
+        return [candidates[i] for i in selected]
+
+    @classmethod
+    async def avector_search(cls, query: str, k: int = 25) -> list[tuple[Document, float]]:
+        """
+        Find the k most similar documents to the query by vectors, using the cache of search results.
+        """
+        if cls._index is None:
+            raise RuntimeError("Vector index not initialized. Call VectorRetriever.init() first.")
+        index = cls._index
+
+        async def search() -> list[tuple[Document, float]]:
+            embedding = await cls.aembed_query(query)
+            return index.similarity_search_with_score_by_vector(embedding, k=k)
+
+        key = (normalize_query(query), index.embeddings.model.value, cls._index_version, k)
+        return await cls._results_cache.get_or_create(key, search)
+
+    @classmethod
+    def cache_stats(cls) -> RetrievalCacheStats:
+        return RetrievalCacheStats(
+            embeddings=cls._embeddings_cache.stats(),
+            results=cls._results_cache.stats(),
+        )
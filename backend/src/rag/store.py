@@ -0,0 +1,267 @@
+__all__ = [
+    "ANN_FILENAME",
+    "CHUNKS_FILENAME",
+    "VECTORS_FILENAME",
+    "ChunkIndex",
+    "ChunkStore",
+    "build_ann_index",
+    "lexical_terms",
+    "write_chunk_index",
+]
+
+import json
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+from src.schemas.rag import IndexSpec, IndexType
+
+CHUNKS_FILENAME = "chunks.sqlite"
+VECTORS_FILENAME = "vectors.npy"
+ANN_FILENAME = "ann.faiss"
+"Approximate FAISS index over the vectors, absent for exact search"
+_IDENTIFIER = re.compile(r"\w+(?:[.\-]\w+)*")
+_IDENTIFIER_PARTS = re.compile(r"[_.\-]+|(?<=[a-zа-яё0-9])(?=[A-ZА-ЯЁ])")
+
+
+def lexical_terms(text: str) -> list[str]:
+    """
+    Terms of the text for the BM25 index. Identifiers like `step_3`, `fieldName` or `a.b.c` are kept whole,
+    so an exact identifier in a query ranks its chunks highest, and are also split into their parts.
+    """
+    terms = []
+    for token in _IDENTIFIER.findall(text):
+        terms.append(token.lower())
+        parts = [part.lower() for part in _IDENTIFIER_PARTS.split(token) if part]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class ChunkStore:
+    """
+    Read-only SQLite file with texts and metadata of the indexed chunks.
+    Id of a chunk is its row in the vectors file, texts are fetched by id only for search hits.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._pid: int | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection must not be used by forked worker processes, each process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, ids: list[int]) -> dict[int, Document]:
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._connect().execute(f"SELECT id, hash, text, metadata FROM chunks WHERE id IN ({placeholders})", ids)
+        return {
+            chunk_id: Document(id=chunk_hash, page_content=text, metadata=json.loads(metadata))
+            for chunk_id, chunk_hash, text, metadata in rows
+        }
+
+    def has_lexical_index(self) -> bool:
+        row = self._connect().execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        return row is not None
+
+    def lexical_search(self, query: str, k: int) -> list[tuple[int, float]]:
+        """
+        Ids of the k chunks best matching the query by BM25, with their scores, best first.
+        """
+        terms = dict.fromkeys(lexical_terms(query))
+        if not terms or not self.has_lexical_index():
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        rows = self._connect().execute(
+            "SELECT rowid, bm25(chunks_fts) FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?",
+            (match, k),
+        )
+        # FTS5 returns negated BM25 scores, so that better matches sort first
+        return [(chunk_id, -score) for chunk_id, score in rows]
+
+    def ids(self, hashes: list[str]) -> list[int]:
+        """
+        Ids of the chunks with the given content hashes, in the same order.
+        """
+        placeholders = ",".join("?" * len(hashes))
+        rows = self._connect().execute(f"SELECT hash, id FROM chunks WHERE hash IN ({placeholders})", hashes)
+        by_hash = dict(rows)
+        return [by_hash[chunk_hash] for chunk_hash in hashes]
+
+    def hashes(self) -> dict[str, int]:
+        """
+        Content hash of each chunk -> its id.
+        """
+        return {chunk_hash: chunk_id for chunk_id, chunk_hash in self._connect().execute("SELECT id, hash FROM chunks")}
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def build_ann_index(vectors: np.ndarray, spec: IndexSpec) -> faiss.Index | None:
+    """
+    Train and fill an approximate index over the vectors. Returns None if search should be exact.
+    """
+    n, dimension = vectors.shape
+    if spec.type == IndexType.FLAT:
+        return None
+    if n < spec.min_training_size():
+        print(f"  ⚠️ {n} chunks are too few to train `{spec.type}` index, using exact search")
+        return None
+    if spec.type == IndexType.IVF_PQ and dimension % spec.pq_m:
+        raise ValueError(f"pq_m={spec.pq_m} must divide the vector dimension {dimension}")
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(dimension, spec.factory_string(n))
+    # search parameters are saved with the index
+    if spec.type == IndexType.HNSW:
+        index.hnsw.efConstruction = spec.hnsw_ef_construction
+        index.hnsw.efSearch = spec.hnsw_ef_search
+    else:
+        faiss.extract_index_ivf(index).nprobe = spec.nprobe
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+class ChunkIndex:
+    """
+    Vectors of the chunks memory-mapped from disk, the optional approximate index over them and the chunk store.
+    Without the approximate index, vectors are searched exactly with FAISS.
+    Opening is instant and all worker processes share the pages through the OS cache.
+    """
+
+    def __init__(self, index_path: str, embeddings: Embeddings) -> None:
+        path = Path(index_path)
+        self.embeddings = embeddings
+        self.vectors: np.ndarray = np.load(path / VECTORS_FILENAME, mmap_mode="r")
+        self.ann: faiss.Index | None = None
+        if (path / ANN_FILENAME).exists():
+            self.ann = faiss.read_index(str(path / ANN_FILENAME), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        self.store = ChunkStore(path / CHUNKS_FILENAME)
+
+    @property
+    def ntotal(self) -> int:
+        return self.vectors.shape[0]
+
+    def warm_up(self) -> None:
+        """
+        Ask the OS to read the index files into the page cache ahead of the first search.
+        """
+        if not hasattr(os, "posix_fadvise"):
+            return
+        path = Path(self.vectors.filename).parent
+        for name in (VECTORS_FILENAME, ANN_FILENAME):
+            if (path / name).exists():
+                with open(path / name, "rb") as f:
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4
+    ) -> list[tuple[Document, float]]:
+        """
+        Return the k nearest chunks with their L2 distances, closest first.
+        """
+        if self.ntotal == 0:
+            return []
+        query = np.asarray([embedding], dtype=np.float32)
+        if self.ann is not None:
+            distances, ids = self.ann.search(query, min(k, self.ntotal))
+        else:
+            distances, ids = faiss.knn(query, self.vectors, min(k, self.ntotal))
+        docs = self.store.get([int(i) for i in ids[0] if i >= 0])
+        return [(docs[int(i)], float(d)) for i, d in zip(ids[0], distances[0], strict=True) if int(i) in docs]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k)
+
+    def vectors_of(self, docs: list[Document]) -> np.ndarray:
+        """
+        Stored vectors of the documents found by this index, read from the memory-mapped file.
+        """
+        ids = self.store.ids([doc.id for doc in docs])
+        return np.asarray(self.vectors[ids], dtype=np.float32)
+
+    def lexical_search_with_score(self, query: str, k: int = 4) -> list[tuple[Document, float]]:
+        """
+        Return the k chunks best matching the query by BM25 with their scores, best first. No upstream calls.
+        """
+        hits = self.store.lexical_search(query, k)
+        docs = self.store.get([chunk_id for chunk_id, _ in hits])
+        return [(docs[chunk_id], score) for chunk_id, score in hits if chunk_id in docs]
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def write_chunk_index(
+    index_path: str, chunks: list[tuple[str, Document]], vectors: np.ndarray, spec: IndexSpec | None = None
+) -> str:
+    """
+    Persist chunks (content hash, document) and their vectors, row i of `vectors` belongs to the i-th chunk.
+    An approximate index is trained on the vectors according to `spec`, a BM25 index is built on the chunk texts.
+    Returns the FAISS description of the index actually used for search.
+
+    Files are written next to the old ones and then replaced, processes that still have the old files open
+    keep reading them consistently.
+    """
+    path = Path(index_path)
+    path.mkdir(parents=True, exist_ok=True)
+    ann = build_ann_index(vectors, spec) if spec is not None else None
+
+    vectors_tmp = path / (VECTORS_FILENAME + ".tmp")
+    with open(vectors_tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+        f.flush()
+        os.fsync(f.fileno())
+
+    chunks_tmp = path / (CHUNKS_FILENAME + ".tmp")
+    chunks_tmp.unlink(missing_ok=True)
+    with sqlite3.connect(chunks_tmp) as connection:
+        connection.execute(
+            "CREATE TABLE chunks (id INTEGER PRIMARY KEY, hash TEXT NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        connection.execute("CREATE INDEX chunks_hash ON chunks (hash)")
+        connection.executemany(
+            "INSERT INTO chunks (id, hash, text, metadata) VALUES (?, ?, ?, ?)",
+            (
+                (i, chunk_hash, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                for i, (chunk_hash, doc) in enumerate(chunks)
+            ),
+        )
+        # terms are extracted by `lexical_terms`, the tokenizer only has to keep them whole
+        connection.execute("CREATE VIRTUAL TABLE chunks_fts USING fts5(terms, tokenize=\"unicode61 tokenchars '_.-'\")")
+        connection.executemany(
+            "INSERT INTO chunks_fts (rowid, terms) VALUES (?, ?)",
+            ((i, " ".join(lexical_terms(doc.page_content))) for i, (_, doc) in enumerate(chunks)),
+        )
+    connection.close()
+
+    ann_tmp = path / (ANN_FILENAME + ".tmp")
+    if ann is not None:
+        faiss.write_index(ann, str(ann_tmp))
+
+    os.replace(vectors_tmp, path / VECTORS_FILENAME)
+    os.replace(chunks_tmp, path / CHUNKS_FILENAME)
+    if ann is not None:
+        os.replace(ann_tmp, path / ANN_FILENAME)
+        return spec.factory_string(len(vectors))
+    (path / ANN_FILENAME).unlink(missing_ok=True)
+    return "Flat"
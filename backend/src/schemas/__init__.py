@@ -1,11 +1,49 @@
 from src.schemas.chat import Models, Roles
-from src.schemas.dialog import ViewDialog
-from src.schemas.message import CreateMessage, ViewMessage
+from src.schemas.dialog import DialogsPage, DialogSummary, ViewDialog
+from src.schemas.job import JobError, JobKind, JobStatus, ViewJob
+from src.schemas.message import CreateMessage, MessagesPage, ViewMessage
+from src.schemas.status import (
+    CacheStats,
+    CircuitBreakerStats,
+    CircuitState,
+    HistoryCacheStats,
+    JobPoolStats,
+    ModelLatencyStats,
+    ResponseCacheStats,
+    RetrievalCacheStats,
+    RoutingStats,
+    SpeculationStats,
+    UpstreamLaneStats,
+    UpstreamLimiterStats,
+    UpstreamPoolStats,
+    UpstreamResilienceStats,
+)
 
 __all__ = [
     "Models",
     "Roles",
     "ViewDialog",
+    "DialogSummary",
+    "DialogsPage",
     "CreateMessage",
     "ViewMessage",
+    "MessagesPage",
+    "UpstreamPoolStats",
+    "CacheStats",
+    "RetrievalCacheStats",
+    "SpeculationStats",
+    "ResponseCacheStats",
+    "HistoryCacheStats",
+    "UpstreamLaneStats",
+    "UpstreamLimiterStats",
+    "CircuitState",
+    "CircuitBreakerStats",
+    "UpstreamResilienceStats",
+    "ModelLatencyStats",
+    "RoutingStats",
+    "JobKind",
+    "JobStatus",
+    "JobError",
+    "ViewJob",
+    "JobPoolStats",
 ]
@@ -1,5 +1,8 @@
+from datetime import datetime
+
 from pydantic import BaseModel, ConfigDict
 
+from src.schemas.chat import Roles
 from src.schemas.message import ViewMessage
 
 
@@ -8,3 +11,26 @@ class ViewDialog(BaseModel):
     messages: list[ViewMessage] = []
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class DialogSummary(BaseModel):
+    id: int
+    message_count: int
+    "Number of messages in the dialog"
+    last_message_id: int | None
+    "ID of the last message"
+    last_role: Roles | None
+    "Role of the author of the last message"
+    last_message_preview: str | None
+    "Beginning of the last message"
+    updated_at: datetime
+    "Time of the last change of the dialog messages"
+
+
+class DialogsPage(BaseModel):
+    dialogs: list[DialogSummary]
+    "Dialogs of the page, recently updated first"
+    has_more: bool
+    "Whether there are less recently updated dialogs"
+    next_cursor: str | None = None
+    "Cursor of the next page to pass as `cursor`, None if there are no more dialogs"
@@ -0,0 +1,56 @@
+from datetime import datetime
+from enum import StrEnum
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict
+
+from src.schemas.chat import Models
+from src.schemas.message import ViewMessage
+
+
+class JobKind(StrEnum):
+    COMPLETION = "completion"
+    "Answer the last user message of the dialog"
+    REGENERATE = "regenerate"
+    "Replace an answer with a new one"
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobError(BaseModel):
+    status_code: int
+    "Status code the synchronous endpoint would have answered with"
+    detail: Any
+    "Error detail the synchronous endpoint would have answered with"
+
+
+class ViewJob(BaseModel):
+    id: int
+    dialog_id: int
+    kind: JobKind
+    model: Models | None
+    "Requested model, the model of the answer for regeneration"
+    message_id: int | None
+    "User message to answer, or the answer to regenerate"
+    priority: int
+    status: JobStatus
+    result_message_id: int | None
+    "ID of the saved answer, when the job has succeeded"
+    result: ViewMessage | None = None
+    "Saved answer, when the job has succeeded and the answer is not deleted since"
+    error: JobError | None
+    "Error of the pipeline, when the job has failed"
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)
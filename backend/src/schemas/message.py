@@ -22,3 +22,10 @@ class CreateMessage(BaseModel):
     reply_to: int | None = None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class MessagesPage(BaseModel):
+    messages: list[ViewMessage]
+    "Messages of the page, oldest first"
+    has_more: bool
+    "Whether there are more messages in the paging direction (older ones, or newer ones when paging by `after_id`)"
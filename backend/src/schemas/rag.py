@@ -0,0 +1,65 @@
+import math
+from enum import StrEnum
+
+from pydantic import BaseModel, Field
+
+
+class IndexType(StrEnum):
+    FLAT = "flat"
+    "Exact search over all vectors"
+    IVF_FLAT = "ivf_flat"
+    "Vectors are clustered, only `nprobe` nearest clusters are searched"
+    HNSW = "hnsw"
+    "Graph-based search, fast and accurate but needs more memory"
+    IVF_PQ = "ivf_pq"
+    "Clustered and compressed with product quantization, the smallest index for large corpora"
+
+
+class IndexSpec(BaseModel):
+    type: IndexType = IndexType.FLAT
+    "Type of the vector index"
+    nlist: int | None = Field(None, ge=1)
+    "Number of IVF clusters, null means ~4*sqrt(number of chunks)"
+    nprobe: int = Field(8, ge=1)
+    "Number of IVF clusters searched by a query"
+    hnsw_m: int = Field(32, ge=2)
+    "Number of neighbours of an HNSW graph node"
+    hnsw_ef_construction: int = Field(40, ge=1)
+    "Size of the candidate list when the HNSW graph is built"
+    hnsw_ef_search: int = Field(64, ge=1)
+    "Size of the candidate list when the HNSW graph is searched"
+    pq_m: int = Field(16, ge=1)
+    "Number of PQ sub-vectors, must divide the vector dimension"
+    pq_nbits: int = Field(8, ge=1, le=16)
+    "Bits per PQ sub-vector code"
+
+    def nlist_for(self, n: int) -> int:
+        """
+        Number of IVF clusters for `n` vectors. Each cluster gets at least 39 training points, as FAISS recommends.
+        """
+        nlist = self.nlist or round(4 * math.sqrt(n))
+        return max(1, min(nlist, n // 39))
+
+    def min_training_size(self) -> int:
+        """
+        Minimal number of vectors needed to train the index.
+        """
+        match self.type:
+            case IndexType.IVF_FLAT:
+                return 39
+            case IndexType.IVF_PQ:
+                return max(39, 2**self.pq_nbits)
+        return 0
+
+    def factory_string(self, n: int) -> str:
+        """
+        Description of the index for `faiss.index_factory`, when it is built for `n` vectors.
+        """
+        match self.type:
+            case IndexType.IVF_FLAT:
+                return f"IVF{self.nlist_for(n)},Flat"
+            case IndexType.HNSW:
+                return f"HNSW{self.hnsw_m}"
+            case IndexType.IVF_PQ:
+                return f"IVF{self.nlist_for(n)},PQ{self.pq_m}x{self.pq_nbits}"
+        return "Flat"
@@ -0,0 +1,219 @@
+from enum import StrEnum
+
+from pydantic import BaseModel
+
+from src.schemas.chat import Models
+
+
+class UpstreamPoolStats(BaseModel):
+    http2: bool
+    "Whether HTTP/2 is negotiated for new connections"
+    max_connections: int
+    "Configured pool size"
+    max_keepalive_connections: int
+    "Configured number of idle keep-alive connections"
+    requests_total: int = 0
+    "Requests sent through the pool since startup"
+    errors_total: int = 0
+    "Requests that failed on the transport level (connect/read errors, timeouts)"
+    in_flight: int = 0
+    "Requests currently holding a connection (including open response streams)"
+    peak_in_flight: int = 0
+    "Maximum value of `in_flight` since startup"
+    connections_open: int = 0
+    "Connections currently open in the pool"
+    connections_idle: int = 0
+    "Open connections that are idle and ready to be reused"
+
+
+class CacheStats(BaseModel):
+    maxsize: int
+    "Maximum number of entries"
+    size: int = 0
+    "Current number of entries"
+    hits: int = 0
+    "Lookups answered from the cache"
+    misses: int = 0
+    "Lookups that had to compute the value"
+    shared: int = 0
+    "Lookups that joined an already running computation of the same key"
+    in_flight: int = 0
+    "Computations currently running"
+    evictions: int = 0
+    "Entries evicted because the cache was full"
+    expirations: int = 0
+    "Entries dropped because their TTL passed"
+
+
+class RetrievalCacheStats(BaseModel):
+    embeddings: CacheStats
+    "Cache of query embeddings"
+    results: CacheStats
+    "Cache of vector search results"
+
+
+class SpeculationStats(BaseModel):
+    runs: int = 0
+    "Pipeline runs in speculative mode"
+    accepted: int = 0
+    "Runs where the validation passed and the speculative answer was used"
+    discarded: int = 0
+    "Runs where the validation failed and the speculative answer was thrown away"
+    cancelled_calls: int = 0
+    "Speculative main model calls cancelled before completion (their token usage is unknown)"
+    saved_seconds: float = 0.0
+    "Total wall-clock time saved by overlapping the main model call with the validation"
+    wasted_prompt_tokens: int = 0
+    "Prompt tokens spent on completed but discarded speculative answers"
+    wasted_completion_tokens: int = 0
+    "Completion tokens spent on completed but discarded speculative answers"
+
+
+class ResponseCacheStats(BaseModel):
+    exact: CacheStats
+    "Cache of answers keyed by the full pipeline input"
+    semantic_hits: int = 0
+    "Exact misses answered by a near-duplicate question"
+    semantic_misses: int = 0
+    "Exact misses without a close enough near-duplicate question"
+
+
+class HistoryCacheStats(BaseModel):
+    maxsize: int
+    "Maximum number of cached dialogs"
+    size: int = 0
+    "Current number of cached dialogs"
+    messages: int = 0
+    "Number of cached messages"
+    memory_bytes: int = 0
+    "Estimated memory size of the cached messages"
+    hits: int = 0
+    "Lookups answered from the cache"
+    misses: int = 0
+    "Lookups of dialogs that were not cached"
+    stale: int = 0
+    "Lookups of entries outdated by another worker"
+    hit_ratio: float = 0.0
+    "Share of lookups answered from the cache"
+    invalidations: int = 0
+    "Entries dropped because the dialog was changed"
+    evictions: int = 0
+    "Entries evicted because the cache was full"
+
+
+class UpstreamLaneStats(BaseModel):
+    endpoint: str
+    "MWS GPT API endpoint"
+    model: Models
+    "Requested model"
+    limit: int
+    "Configured maximum number of concurrent requests"
+    window: int
+    "Current maximum number of concurrent requests, halved after 429 responses and grown back after successes"
+    active: int = 0
+    "Requests currently sent"
+    queued: int = 0
+    "Requests waiting for their turn"
+    peak_queued: int = 0
+    "Maximum value of `queued` since startup"
+    paused_seconds: float = 0.0
+    "Time left until requests are sent again after a 429 response"
+    requests_total: int = 0
+    "Requests that asked for a turn since startup"
+    rejected: int = 0
+    "Requests rejected because the queue was full or the wait timed out"
+    throttled: int = 0
+    "Responses with status 429"
+    wait_seconds_total: float = 0.0
+    "Total time requests waited in the queue"
+    mean_wait_seconds: float = 0.0
+    "Mean time a request waited in the queue"
+    max_wait_seconds: float = 0.0
+    "Maximum time a request waited in the queue"
+
+
+class UpstreamLimiterStats(BaseModel):
+    lanes: list[UpstreamLaneStats]
+    "One lane per endpoint and model"
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    "Calls go through"
+    OPEN = "open"
+    "Calls fail fast"
+    HALF_OPEN = "half_open"
+    "A single trial call goes through"
+
+
+class CircuitBreakerStats(BaseModel):
+    model: Models
+    "Model the breaker guards"
+    state: CircuitState = CircuitState.CLOSED
+    "Current state of the breaker"
+    open_seconds_left: float = 0.0
+    "Time left until a trial call is let through, when the breaker is open"
+    consecutive_failures: int = 0
+    "Failed attempts since the last successful one"
+    failures_total: int = 0
+    "Failed attempts since startup: transport errors, timeouts and 5xx responses"
+    retries: int = 0
+    "Attempts repeated after transient errors"
+    opened_total: int = 0
+    "Number of times the breaker opened"
+    rejected: int = 0
+    "Calls failed fast while the breaker was open"
+
+
+class UpstreamResilienceStats(BaseModel):
+    breakers: list[CircuitBreakerStats]
+    "One circuit breaker per model"
+
+
+class ModelLatencyStats(BaseModel):
+    model: Models
+    "Model the latency is measured for"
+    calls: int = 0
+    "Calls measured since startup, a call cancelled by a faster hedge counts with the time it waited"
+    ewma_seconds: float = 0.0
+    "Exponentially weighted moving average of the time to the first answer"
+    recent_calls: int = 0
+    "Calls within the latency window"
+    p50_seconds: float = 0.0
+    "Median time to the first answer within the latency window"
+    p95_seconds: float = 0.0
+    "95th percentile of the time to the first answer within the latency window"
+    rerouted: int = 0
+    "Calls sent to the fallback because the p95 latency exceeded the SLO"
+    hedged: int = 0
+    "Calls duplicated to the fallback because the model did not answer in time"
+    hedge_wins: int = 0
+    "Hedged calls answered by the fallback first"
+
+
+class RoutingStats(BaseModel):
+    models: list[ModelLatencyStats]
+    "Latency and routing counters of every called model"
+
+
+class JobPoolStats(BaseModel):
+    workers: int
+    "Number of workers running completion jobs"
+    max_queue: int
+    "Maximum number of queued jobs"
+    running: int = 0
+    "Jobs currently run by the workers"
+    queued: int = 0
+    "Jobs waiting for a free worker"
+    submitted: int = 0
+    "Jobs accepted since startup"
+    succeeded: int = 0
+    "Jobs that saved an answer"
+    failed: int = 0
+    "Jobs that ended with an error"
+    rejected: int = 0
+    "Jobs rejected because the queue was full"
+    wait_seconds_total: float = 0.0
+    "Total time jobs waited in the queue"
+    max_wait_seconds: float = 0.0
+    "Longest time a job waited in the queue"
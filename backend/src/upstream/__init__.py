@@ -0,0 +1,15 @@
+from src.upstream.client import MwsClient
+from src.upstream.limiter import UpstreamBusyError, UpstreamLimiter
+from src.upstream.resilience import CircuitBreaker, CircuitOpenError, resilient_request, upstream_timeout
+from src.upstream.routing import ModelRouter
+
+__all__ = [
+    "MwsClient",
+    "UpstreamBusyError",
+    "UpstreamLimiter",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "resilient_request",
+    "upstream_timeout",
+    "ModelRouter",
+]
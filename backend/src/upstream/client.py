@@ -0,0 +1,146 @@
+__all__ = ["MwsClient"]
+
+import importlib.util
+from collections.abc import AsyncIterator
+
+from httpx import (
+    AsyncBaseTransport,
+    AsyncByteStream,
+    AsyncClient,
+    AsyncHTTPTransport,
+    Limits,
+    Request,
+    Response,
+)
+
+from src.api.logging_ import logger
+from src.config import api_settings
+from src.schemas.status import UpstreamPoolStats
+from src.upstream.resilience import upstream_timeout
+
+
+class _ReleasingStream(AsyncByteStream):
+    """
+    Response stream wrapper that reports when the response is closed and its connection is returned to the pool.
+    """
+
+    def __init__(self, stream: AsyncByteStream, transport: "_PoolStatsTransport") -> None:
+        self._stream = stream
+        self._transport = transport
+        self._released = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._transport.stats.in_flight -= 1
+
+
+class _PoolStatsTransport(AsyncBaseTransport):
+    """
+    Transport wrapper that counts requests going through the connection pool.
+    """
+
+    def __init__(self, transport: AsyncHTTPTransport, stats: UpstreamPoolStats) -> None:
+        self._transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: Request) -> Response:
+        self.stats.requests_total += 1
+        self.stats.in_flight += 1
+        self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.stats.in_flight -= 1
+            self.stats.errors_total += 1
+            raise
+        response.stream = _ReleasingStream(response.stream, self)
+        return response
+
+    def connections(self) -> tuple[int, int]:
+        """
+        Return the number of open and idle connections in the underlying pool.
+        """
+        pool = getattr(self._transport, "_pool", None)
+        if pool is None:
+            return 0, 0
+        connections = pool.connections
+        return len(connections), sum(1 for conn in connections if conn.is_idle())
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class MwsClient:
+    """
+    Long-lived pooled HTTP client for MWS GPT API shared by the whole application.
+    Created in the application lifespan and closed on shutdown, so connections are kept alive between calls.
+    """
+
+    _client: AsyncClient | None = None
+    _transport: _PoolStatsTransport | None = None
+    _stats: UpstreamPoolStats | None = None
+
+    @classmethod
+    def init(cls) -> None:
+        """
+        Create the shared client according to the pool settings
+        """
+        http2 = api_settings.mws_gpt_http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 for MWS GPT API is enabled, but `h2` package is not installed. Using HTTP/1.1")
+            http2 = False
+
+        limits = Limits(
+            max_connections=api_settings.mws_gpt_max_connections,
+            max_keepalive_connections=api_settings.mws_gpt_max_keepalive_connections,
+            keepalive_expiry=api_settings.mws_gpt_keepalive_expiry,
+        )
+        cls._stats = UpstreamPoolStats(
+            http2=http2,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+        )
+        cls._transport = _PoolStatsTransport(AsyncHTTPTransport(limits=limits, http2=http2), cls._stats)
+        cls._client = AsyncClient(
+            transport=cls._transport,
+            headers={"Authorization": f"Bearer {api_settings.mws_gpt_api_key.get_secret_value()}"},
+            timeout=upstream_timeout(),
+        )
+
+    @classmethod
+    def get(cls) -> AsyncClient:
+        """
+        Get the shared client
+        """
+        if cls._client is None:
+            raise RuntimeError("MWS GPT client not initialized. Call MwsClient.init() first.")
+        return cls._client
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        Close all pooled connections
+        """
+        if cls._client is not None:
+            await cls._client.aclose()
+        cls._client = None
+        cls._transport = None
+
+    @classmethod
+    def stats(cls) -> UpstreamPoolStats:
+        """
+        Get a snapshot of the pool utilisation counters
+        """
+        if cls._stats is None or cls._transport is None:
+            raise RuntimeError("MWS GPT client not initialized. Call MwsClient.init() first.")
+        snapshot = cls._stats.model_copy()
+        snapshot.connections_open, snapshot.connections_idle = cls._transport.connections()
+        return snapshot
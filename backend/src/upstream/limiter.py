@@ -0,0 +1,242 @@
+__all__ = ["UpstreamBusyError", "UpstreamLimiter"]
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from httpx import Response
+
+from src.api.logging_ import logger
+from src.config import api_settings
+from src.schemas.chat import Models
+from src.schemas.status import UpstreamLaneStats, UpstreamLimiterStats
+
+
+class UpstreamBusyError(Exception):
+    """
+    The request was not sent because the queue to the model is full or the wait in it timed out.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(response: Response) -> float | None:
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", "")))
+    except ValueError:
+        return None
+
+
+class _Lane:
+    """
+    Requests to one endpoint and model: at most `window` of them run at once, at most `rate` start per second,
+    the rest wait in a bounded FIFO queue.
+
+    The window shrinks by half when the API answers 429 and grows back by one request per window of successful
+    requests (AIMD), so the lane settles just below the quota. After 429 no request starts until `Retry-After` passes.
+    """
+
+    def __init__(self, endpoint: str, model: Models, limit: int, rate: float | None, max_queue: int) -> None:
+        self.limit = limit
+        self.rate = rate
+        self.max_queue = max_queue
+        self.window = float(limit)
+        self.active = 0
+        self.paused_until = 0.0
+        self.tokens = max(1.0, rate or 0)
+        self.refilled_at = time.monotonic()
+        self.waiters: deque[asyncio.Future] = deque()
+        self._timer: asyncio.TimerHandle | None = None
+        self.stats = UpstreamLaneStats(endpoint=endpoint, model=model, limit=limit, window=limit)
+
+    def _refill(self, now: float) -> None:
+        if self.rate is None:
+            return
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def _delay(self, now: float) -> float:
+        """
+        Time until a new request may start, 0 if it may start now, inf if it waits for a running request.
+        """
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.active >= max(1, int(self.window)):
+            return float("inf")
+        self._refill(now)
+        if self.rate is not None and self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0.0
+
+    def _start(self) -> None:
+        self.active += 1
+        if self.rate is not None:
+            self.tokens -= 1
+
+    def _wake(self) -> None:
+        self._timer = None
+        while self.waiters:
+            if self.waiters[0].done():
+                # cancelled or timed out
+                self.waiters.popleft()
+                continue
+            delay = self._delay(time.monotonic())
+            if delay == float("inf"):
+                return
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+                return
+            self._start()
+            self.waiters.popleft().set_result(None)
+
+    async def acquire(self, timeout: float | None) -> None:
+        self.stats.requests_total += 1
+        if not self.waiters and self._delay(time.monotonic()) == 0:
+            self._start()
+            self._record_wait(0.0)
+            return
+
+        if len(self.waiters) >= self.max_queue:
+            self.stats.rejected += 1
+            raise UpstreamBusyError(f"Too many queued requests to {self.stats.model}", self.retry_after())
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.stats.peak_queued = max(self.stats.peak_queued, len(self.waiters))
+        if self._timer is None:
+            self._wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was granted at the same moment, give it to the next request
+                self.release()
+            else:
+                waiter.cancel()
+            if isinstance(e, TimeoutError):
+                self.stats.rejected += 1
+                raise UpstreamBusyError(
+                    f"Request to {self.stats.model} waited in the queue for {timeout} s", self.retry_after()
+                ) from None
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    def release(self) -> None:
+        self.active -= 1
+        if self._timer is None:
+            self._wake()
+
+    def _record_wait(self, seconds: float) -> None:
+        self.stats.wait_seconds_total += seconds
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, seconds)
+
+    def observe(self, response: Response) -> None:
+        """
+        Adapt the window and pacing to the response status.
+        """
+        if response.status_code == 429:
+            self.stats.throttled += 1
+            self.window = max(1.0, self.window / 2)
+            pause = _retry_after(response) or api_settings.upstream_default_retry_after
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            logger.warning(
+                f"MWS GPT API throttled {self.stats.endpoint} of {self.stats.model}: "
+                f"concurrency {int(self.window)}, paused for {pause:.1f} s"
+            )
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._wake()
+        elif response.is_success:
+            self.window = min(float(self.limit), self.window + 1 / self.window)
+
+    def retry_after(self) -> float:
+        """
+        Time a rejected client should wait before retrying.
+        """
+        return max(self.paused_until - time.monotonic(), api_settings.upstream_default_retry_after)
+
+    def snapshot(self) -> UpstreamLaneStats:
+        snapshot = self.stats.model_copy()
+        snapshot.window = max(1, int(self.window))
+        snapshot.active = self.active
+        snapshot.queued = sum(1 for waiter in self.waiters if not waiter.done())
+        snapshot.paused_seconds = max(0.0, self.paused_until - time.monotonic())
+        if snapshot.requests_total - snapshot.rejected > 0:
+            snapshot.mean_wait_seconds = snapshot.wait_seconds_total / (snapshot.requests_total - snapshot.rejected)
+        return snapshot
+
+
+class _Slot:
+    def __init__(self, lane: _Lane) -> None:
+        self._lane = lane
+
+    def observe(self, response: Response) -> None:
+        """
+        Report the response status to the scheduler, so it backs off after 429.
+        """
+        self._lane.observe(response)
+
+
+class UpstreamLimiter:
+    """
+    Scheduler of MWS GPT API requests of the current worker, one lane per endpoint and model.
+    Created in the application lifespan.
+    """
+
+    _lanes: dict[tuple[str, Models], _Lane] | None = None
+
+    @classmethod
+    def init(cls) -> None:
+        """
+        Create empty lanes, they are added on the first request to each endpoint and model
+        """
+        cls._lanes = {}
+
+    @classmethod
+    def is_initialized(cls) -> bool:
+        return cls._lanes is not None
+
+    @classmethod
+    def _lane(cls, endpoint: str, model: Models) -> _Lane:
+        if cls._lanes is None:
+            raise RuntimeError("Upstream limiter not initialized. Call UpstreamLimiter.init() first.")
+        lane = cls._lanes.get((endpoint, model))
+        if lane is None:
+            lane = _Lane(
+                endpoint,
+                model,
+                limit=api_settings.upstream_concurrency_limits.get(model, api_settings.upstream_max_concurrency),
+                rate=api_settings.upstream_rate_limit,
+                max_queue=api_settings.upstream_max_queue,
+            )
+            cls._lanes[(endpoint, model)] = lane
+        return lane
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, endpoint: str, model: Models) -> AsyncIterator[_Slot]:
+        """
+        Wait for a turn to send a request to the endpoint for the model, the slot is held until the block exits.
+        Raises `UpstreamBusyError` if the queue is full or the wait exceeds `upstream_queue_timeout`.
+        """
+        lane = cls._lane(endpoint, model)
+        await lane.acquire(api_settings.upstream_queue_timeout)
+        try:
+            yield _Slot(lane)
+        finally:
+            lane.release()
+
+    @classmethod
+    def stats(cls) -> UpstreamLimiterStats:
+        """
+        Get a snapshot of the queue and pacing counters of all lanes
+        """
+        if cls._lanes is None:
+            raise RuntimeError("Upstream limiter not initialized. Call UpstreamLimiter.init() first.")
+        return UpstreamLimiterStats(lanes=[lane.snapshot() for lane in cls._lanes.values()])
@@ -0,0 +1,220 @@
+__all__ = ["CircuitBreaker", "CircuitOpenError", "resilient_request", "upstream_timeout"]
+
+import asyncio
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+
+from httpx import Response, Timeout, TimeoutException, TransportError
+
+from src.api.logging_ import logger
+from src.config import api_settings
+from src.schemas.chat import Models
+from src.schemas.status import CircuitBreakerStats, CircuitState, UpstreamResilienceStats
+from src.upstream.limiter import UpstreamBusyError, UpstreamLimiter
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 10.0
+"Maximal delay between retries in seconds, unless the API asks for more with `Retry-After`"
+
+
+class CircuitOpenError(UpstreamBusyError):
+    """
+    The request was not sent because the circuit breaker of the model is open.
+    """
+
+
+def upstream_timeout() -> Timeout:
+    """
+    Connect and read timeouts of MWS GPT API requests. The read timeout is the longest silence of the upstream:
+    the whole answer of a non-streaming call or the gap between chunks of a stream.
+    """
+    return Timeout(api_settings.upstream_read_timeout, connect=api_settings.upstream_connect_timeout)
+
+
+class CircuitBreaker:
+    """
+    Breaker of the calls to one model.
+
+    Closed: calls go through. After `upstream_breaker_failure_threshold` consecutive failed attempts (transport errors,
+    timeouts, 5xx responses) it opens and fails calls fast for `upstream_breaker_reset_timeout`.
+    Then it is half-open: a single trial attempt goes through, its success closes the breaker, its failure opens it
+    again. 429 responses say nothing about the health of the upstream and are not counted.
+    """
+
+    _breakers: dict[Models, "CircuitBreaker"] = {}
+
+    def __init__(self, model: Models) -> None:
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.stats = CircuitBreakerStats(model=model)
+
+    @classmethod
+    def of(cls, model: Models) -> "CircuitBreaker":
+        breaker = cls._breakers.get(model)
+        if breaker is None:
+            breaker = cls._breakers[model] = cls(model)
+        return breaker
+
+    @classmethod
+    def all_stats(cls) -> UpstreamResilienceStats:
+        return UpstreamResilienceStats(breakers=[breaker.snapshot() for breaker in cls._breakers.values()])
+
+    def _open_seconds_left(self) -> float:
+        return max(0.0, self.opened_at + api_settings.upstream_breaker_reset_timeout - time.monotonic())
+
+    def before_call(self) -> None:
+        """
+        Raise `CircuitOpenError` if the call must not be sent.
+        """
+        if self.state == CircuitState.OPEN:
+            if self._open_seconds_left() > 0:
+                self.stats.rejected += 1
+                raise CircuitOpenError(
+                    f"MWS GPT API is unavailable for {self.stats.model}, circuit breaker is open",
+                    self._open_seconds_left(),
+                )
+            self.state = CircuitState.HALF_OPEN
+        if self.state == CircuitState.HALF_OPEN:
+            if self.trial_in_flight:
+                self.stats.rejected += 1
+                raise CircuitOpenError(
+                    f"MWS GPT API is unavailable for {self.stats.model}, waiting for a trial call",
+                    api_settings.upstream_default_retry_after,
+                )
+            self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.trial_in_flight = False
+        self.stats.consecutive_failures = 0
+        if self.state != CircuitState.CLOSED:
+            logger.info(f"Circuit breaker of {self.stats.model} is closed")
+        self.state = CircuitState.CLOSED
+
+    def record_failure(self) -> None:
+        self.trial_in_flight = False
+        self.stats.consecutive_failures += 1
+        self.stats.failures_total += 1
+        if self.state == CircuitState.HALF_OPEN or (
+            self.state == CircuitState.CLOSED
+            and self.stats.consecutive_failures >= api_settings.upstream_breaker_failure_threshold
+        ):
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+            self.stats.opened_total += 1
+            logger.warning(
+                f"Circuit breaker of {self.stats.model} is open after {self.stats.consecutive_failures} failed calls"
+            )
+
+    def record_neutral(self) -> None:
+        """
+        The call neither proves nor disproves the health of the upstream (429, cancelled by the client).
+        """
+        self.trial_in_flight = False
+
+    def snapshot(self) -> CircuitBreakerStats:
+        snapshot = self.stats.model_copy()
+        snapshot.state = self.state
+        if self.state == CircuitState.OPEN:
+            snapshot.open_seconds_left = self._open_seconds_left()
+        return snapshot
+
+
+def _backoff(attempt: int, response: Response | None) -> float:
+    if response is not None:
+        try:
+            return max(0.0, float(response.headers.get("Retry-After", "")))
+        except ValueError:
+            pass
+    return min(MAX_BACKOFF, api_settings.upstream_retry_backoff * 2**attempt) * random.uniform(0.5, 1.5)
+
+
+@asynccontextmanager
+async def resilient_request(
+    endpoint: str, model: Models, send: Callable[[], Awaitable[Response]]
+) -> AsyncIterator[Response]:
+    """
+    Send a request to MWS GPT API through the circuit breaker and the limiter of the model, retrying transient errors.
+
+    `send` makes one attempt and may be called several times, so it must be idempotent (completions and embeddings
+    are). Connection errors, timeouts and 429/5xx responses are retried with jittered exponential backoff
+    (or `Retry-After`), the limiter slot is not held while waiting. The response of the last attempt is yielded and
+    closed when the block exits; the limiter slot is held until then, so a stream can be read inside the block.
+    The whole call, the block included, is limited by `upstream_total_timeout`.
+    """
+    breaker = CircuitBreaker.of(model)
+    loop = asyncio.get_running_loop()
+    total = api_settings.upstream_total_timeout
+    deadline = loop.time() + total if total is not None else None
+
+    def fits(delay: float) -> bool:
+        return deadline is None or loop.time() + delay < deadline
+
+    attempt = 0
+    yielded = False
+    while True:
+        breaker.before_call()
+        # the deadline counts against the upstream only while a request or its stream is in flight,
+        # not while the request waits for a limiter slot
+        in_flight = False
+        try:
+            async with asyncio.timeout_at(deadline) as total_timeout, UpstreamLimiter.slot(endpoint, model) as slot:
+                in_flight = True
+                try:
+                    response = await send()
+                except TransportError:
+                    breaker.record_failure()
+                    raise
+                slot.observe(response)
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                elif response.status_code == 429:
+                    breaker.record_neutral()
+                else:
+                    breaker.record_success()
+
+                delay = _backoff(attempt, response)
+                if (
+                    response.status_code not in RETRYABLE_STATUSES
+                    or attempt >= api_settings.upstream_max_retries
+                    or not fits(delay)
+                ):
+                    yielded = True
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+                in_flight = False
+                await response.aclose()
+        except TimeoutError:
+            if not total_timeout.expired():
+                # a timeout of the caller's block, not of this call
+                if breaker.trial_in_flight:
+                    breaker.record_neutral()
+                raise
+            if in_flight:
+                breaker.record_failure()
+            else:
+                breaker.record_neutral()
+            raise TimeoutException(f"MWS GPT API call to {model} exceeded the total timeout of {total} s") from None
+        except TransportError as e:
+            if yielded:
+                # a stream broke after the response was handed out, it cannot be sent again
+                breaker.record_failure()
+                raise
+            delay = _backoff(attempt, None)
+            if attempt >= api_settings.upstream_max_retries or not fits(delay):
+                raise
+            logger.warning(f"MWS GPT API call to {model} failed ({e!r}), retrying in {delay:.1f} s")
+        except BaseException:
+            # cancelled by the client or an error of the caller's block, the trial call must not stay reserved
+            if breaker.trial_in_flight:
+                breaker.record_neutral()
+            raise
+
+        breaker.stats.retries += 1
+        attempt += 1
+        await asyncio.sleep(delay)
@@ -0,0 +1,235 @@
+__all__ = ["ModelRouter"]
+
+import asyncio
+import math
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import TypeVar
+
+from src.api.logging_ import logger
+from src.config import api_settings
+from src.schemas.chat import Models
+from src.schemas.status import ModelLatencyStats, RoutingStats
+
+T = TypeVar("T")
+
+
+class _ModelLatency:
+    """
+    Latency of one model: EWMA over all calls and percentiles over the calls of the last `routing_latency_window`
+    seconds. Latency is the time until the first content of the answer (the whole answer for non-streaming calls).
+    """
+
+    def __init__(self, model: Models) -> None:
+        self.samples: deque[tuple[float, float]] = deque(maxlen=1000)
+        self.stats = ModelLatencyStats(model=model)
+
+    def observe(self, seconds: float) -> None:
+        alpha = api_settings.routing_ewma_alpha
+        if self.stats.calls == 0:
+            self.stats.ewma_seconds = seconds
+        else:
+            self.stats.ewma_seconds = alpha * seconds + (1 - alpha) * self.stats.ewma_seconds
+        self.stats.calls += 1
+        self.samples.append((time.monotonic(), seconds))
+
+    def recent(self) -> list[float]:
+        horizon = time.monotonic() - api_settings.routing_latency_window
+        while self.samples and self.samples[0][0] < horizon:
+            self.samples.popleft()
+        return sorted(seconds for _, seconds in self.samples)
+
+    def p95(self) -> float | None:
+        """
+        95th percentile of recent latency, None if there are too few recent calls to trust it.
+        """
+        recent = self.recent()
+        if len(recent) < api_settings.routing_min_samples:
+            return None
+        return _percentile(recent, 0.95)
+
+    def snapshot(self) -> ModelLatencyStats:
+        snapshot = self.stats.model_copy()
+        recent = self.recent()
+        snapshot.recent_calls = len(recent)
+        if recent:
+            snapshot.p50_seconds = _percentile(recent, 0.5)
+            snapshot.p95_seconds = _percentile(recent, 0.95)
+        return snapshot
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+class ModelRouter:
+    """
+    Routing of the main generation of the current worker by the observed latency of models.
+
+    A model whose recent p95 latency exceeds `routing_latency_slo` is replaced by its fallback from `routing_fallbacks`
+    until its slow calls leave the latency window. If the chosen model has not started to answer in
+    `routing_hedge_after` seconds, the same request is also sent to its fallback and the first answer wins,
+    the other call is cancelled.
+    """
+
+    _models: dict[Models, _ModelLatency] = {}
+
+    @classmethod
+    def _latency(cls, model: Models) -> _ModelLatency:
+        latency = cls._models.get(model)
+        if latency is None:
+            latency = cls._models[model] = _ModelLatency(model)
+        return latency
+
+    @classmethod
+    def observe(cls, model: Models, seconds: float) -> None:
+        cls._latency(model).observe(seconds)
+
+    @classmethod
+    def route(cls, model: Models) -> Models:
+        """
+        Model to send the call to instead of `model`.
+        """
+        fallback = api_settings.routing_fallbacks.get(model)
+        slo = api_settings.routing_latency_slo
+        if fallback is None or slo is None:
+            return model
+        p95 = cls._latency(model).p95()
+        if p95 is None or p95 <= slo:
+            return model
+        fallback_p95 = cls._latency(fallback).p95()
+        if fallback_p95 is not None and fallback_p95 >= p95:
+            return model
+        cls._latency(model).stats.rerouted += 1
+        logger.info(f"{model} is rerouted to {fallback}: p95 latency {p95:.1f} s exceeds SLO {slo:.1f} s")
+        return fallback
+
+    @classmethod
+    def _hedge_target(cls, requested: Models, chosen: Models) -> Models | None:
+        fallback = api_settings.routing_fallbacks.get(chosen)
+        if api_settings.routing_hedge_after is None or fallback is None or fallback == requested:
+            return None
+        return fallback
+
+    @classmethod
+    async def complete(cls, model: Models, call: Callable[[Models], Awaitable[T]]) -> tuple[T, Models]:
+        """
+        Run `call` for the routed model, hedged by its fallback. Return the result and the model that produced it.
+        """
+        chosen = cls.route(model)
+        fallback = cls._hedge_target(model, chosen)
+        loop = asyncio.get_running_loop()
+
+        async def timed(target: Models) -> tuple[T, Models]:
+            start = loop.time()
+            try:
+                result = await call(target)
+            except asyncio.CancelledError:
+                # the hedge answered first: the latency is at least that long, so the model still looks slow
+                cls.observe(target, loop.time() - start)
+                raise
+            cls.observe(target, loop.time() - start)
+            return result, target
+
+        if fallback is None:
+            return await timed(chosen)
+
+        pending = {asyncio.create_task(timed(chosen))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=api_settings.routing_hedge_after)
+            if not done:
+                cls._latency(chosen).stats.hedged += 1
+                pending.add(asyncio.create_task(timed(fallback)))
+            error: BaseException | None = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        result, used = task.result()
+                        if used != chosen:
+                            cls._latency(chosen).stats.hedge_wins += 1
+                        return result, used
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @classmethod
+    async def stream(
+        cls, model: Models, open_stream: Callable[[Models], AsyncIterator[str]]
+    ) -> AsyncIterator[tuple[Models, str]]:
+        """
+        Same as `complete` for streams: the stream that yields its first delta first wins.
+        Yields the model that produces the stream with every delta.
+        """
+        chosen = cls.route(model)
+        fallback = cls._hedge_target(model, chosen)
+        loop = asyncio.get_running_loop()
+        # every stream is read by its own task, so the timeouts of its request stay bound to that task;
+        # `None` marks the end of a stream
+        chunks: asyncio.Queue[tuple[Models, str | BaseException | None]] = asyncio.Queue()
+
+        async def pump(target: Models) -> None:
+            start = loop.time()
+            first = True
+            try:
+                async for delta in open_stream(target):
+                    if first:
+                        cls.observe(target, loop.time() - start)
+                        first = False
+                    chunks.put_nowait((target, delta))
+                chunks.put_nowait((target, None))
+            except asyncio.CancelledError:
+                if first:
+                    cls.observe(target, loop.time() - start)
+                raise
+            except Exception as e:
+                chunks.put_nowait((target, e))
+
+        pumps = {chosen: asyncio.create_task(pump(chosen))}
+        hedged = fallback is None
+        try:
+            winner: Models | None = None
+            while winner is None:
+                try:
+                    async with asyncio.timeout(None if hedged else api_settings.routing_hedge_after):
+                        target, item = await chunks.get()
+                except TimeoutError:
+                    hedged = True
+                    cls._latency(chosen).stats.hedged += 1
+                    pumps[fallback] = asyncio.create_task(pump(fallback))
+                    continue
+                if isinstance(item, BaseException):
+                    del pumps[target]
+                    if not pumps:
+                        raise item
+                    continue
+                winner = target
+                for other, task in pumps.items():
+                    if other != winner:
+                        task.cancel()
+                if winner != chosen:
+                    cls._latency(chosen).stats.hedge_wins += 1
+
+            while True:
+                # chunks of the cancelled stream may still be queued
+                if target == winner:
+                    if item is None:
+                        return
+                    if isinstance(item, BaseException):
+                        raise item
+                    yield winner, item
+                target, item = await chunks.get()
+        finally:
+            for task in pumps.values():
+                task.cancel()
+
+    @classmethod
+    def stats(cls) -> RoutingStats:
+        return RoutingStats(models=[latency.snapshot() for latency in cls._models.values()])